@@ -1,4 +1,23 @@
-from dwavesolver import DwaveSolver
+'''
+Parameter sweep over problem sizes, solvers, sub-QUBO sizes and seeds.
+Jobs run in a process pool and every finished job is added to the
+results store straight away, so an interrupted sweep picks up where
+it stopped when it is started again.
+'''
+
+import argparse
+import sys
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from timeit import default_timer as timer
+
+from conformation import ConformationBatch
+from dwavesolver import DwaveSolver, sample_repetition
+from localsearch import LocalSearchSolver
+from qubocache import QuboCache
+from resultstore import ResultStore, DEFAULT_FILEPATH
 
 # SUB_QUBO_SIZES = [12, 24, 48, 64, 100, 128, 200]
 SUB_QUBO_SIZES = [12, 24]
@@ -8,20 +27,135 @@ PROB_SIZES = [
     # [8, 6],
     # [8, 8]
 ]
+SOLVERS = ['tabu', 'local']     # 'sim_anneal' also works
+SEEDS = [0]
+
+
+def make_jobs(prob_sizes, solvers, sub_sizes, seeds):
+    """
+    Every (B, L, solver, sub_size, seed) combination, grouped by problem
+    size so that workers can reuse the hamiltonian they built.
+    The local search does not split the problem so it has no sub_size
+    """
+    jobs = []
+    for [B, L] in prob_sizes:
+        for solver in solvers:
+            for sub_size in (sub_sizes if solver != 'local' else [None]):
+                for seed in seeds:
+                    jobs.append({
+                        'n_atoms': B,
+                        'lattice_length': L,
+                        'solver': solver,
+                        'sub_size': sub_size,
+                        'seed': seed
+                    })
+    return jobs
+
+
+def job_key(job):
+    return f"{job['n_atoms']}x{job['lattice_length']}/{job['solver']}/{job['sub_size']}/{job['seed']}"
+
+
+# problems built by this worker process, keyed by (B, L)
+_problems = {}
+
+
+def get_problem(B, L):
+    if (B, L) not in _problems:
+        solver = DwaveSolver(B, L)
+        _problems[(B, L)] = (solver, solver.make_bqm(cache=QuboCache()))
+    return _problems[(B, L)]
+
+
+def run_job(job):
+    """
+    Solves one job and returns its result record
+    """
+    B, L = job['n_atoms'], job['lattice_length']
+    start_time = timer()
+
+    if job['solver'] == 'local':
+        solver = LocalSearchSolver(B, L)
+        cells, _, _ = solver.anneal(np.random.default_rng(job['seed']), solver.SWEEPS)
+        conformation = ConformationBatch.from_cells(solver, cells, solver='local')[0]
+    else:
+        solver, Q = get_problem(B, L)
+        if job['solver'] == 'sim_anneal':
+            import neal
+            sampler = neal.SimulatedAnnealingSampler()
+        else:
+            sampler = job['solver']
+        options = {'verbosity': -1, 'solver': sampler, 'solver_limit': job['sub_size']}
+        response, _ = sample_repetition(Q, options, job['seed'])
+
+        best = np.argmin(response.record.energy)
+        conformation = ConformationBatch.from_samples(
+            solver, solver.sampleset_to_array(response)[best][None, :],
+            response.record.energy[best][None], job['solver'])[0]
+
+    return dict(job, **{
+        'job': job_key(job),
+        'conformation': conformation,
+        'time': timer() - start_time
+    })
+
+
+def run_sweep(jobs, file_path=DEFAULT_FILEPATH, workers=1):
+    """
+    Runs the jobs not in the store yet and stores each as it finishes.
+    A job that fails is reported and left out, the others are still
+    stored, so running the sweep again retries only the failed ones.
+    Returns the keys of the failed jobs
+    """
+    failed = []
+    with ResultStore(file_path) as store:
+        finished = store.finished_jobs()
+        pending = [job for job in jobs if job_key(job) not in finished]
+        print(f'{len(jobs) - len(pending)} of {len(jobs)} jobs already done')
+
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(run_job, job): job for job in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception:
+                    failed.append(job_key(futures[future]))
+                    print(f'{failed[-1]}: failed', file=sys.stderr)
+                    traceback.print_exc()
+                    continue
+                conformation = result['conformation']
+                store.add_conformation(conformation, job=result['job'], source='batch.py')
+                print(f"{result['job']}: U {conformation.U}, valid {conformation.valid},"
+                      f" {result['time']:.2f} s")
+
+        report_distinct(store, jobs)
+    if failed:
+        print(f'{len(failed)} of {len(pending)} jobs failed: {", ".join(failed)}', file=sys.stderr)
+    return failed
+
+
+def report_distinct(store, jobs):
+    """
+    For every problem size and solver of jobs, how many of the valid
+    conformations in the store differ by more than a lattice symmetry
+    """
+    for (B, L) in sorted({(job['n_atoms'], job['lattice_length']) for job in jobs}):
+        found = store.conformations(B, L, valid=True)
+        problem = DwaveSolver(B, L)
+        for name in sorted({job['solver'] for job in jobs}):
+            by_solver = found[found.solver == name]
+            distinct, _ = by_solver.distinct(problem)
+            print(f'{B}x{L} {name}: {len(distinct)} distinct of {len(by_solver)} valid conformations')
+
 
 if __name__ == "__main__":
-    solverClass = DwaveSolver
-    options = {
-        'verbosity': 0,
-        'solver': 'tabu',
-        'solver_limit': 48,
-        'no_time': False,
-        'top_samples': 0
-    }
-    for [B, L] in PROB_SIZES:
-        solver = solverClass(B, L)
-        for sub_size in SUB_QUBO_SIZES:
-            options['solver_limit'] = sub_size
-            print("---------------------------")
-            print(f"ATOMS {B}, LATTICE {L}, sub_size {sub_size}")
-            solver.solve(options)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='how many jobs to run at once. Default 1')
+    parser.add_argument('-o', '--output', type=Path, default=DEFAULT_FILEPATH,
+                        help='results store (SQLite) the results are added to')
+    args = parser.parse_args()
+
+    jobs = make_jobs(PROB_SIZES, SOLVERS, SUB_QUBO_SIZES, SEEDS)
+    if run_sweep(jobs, args.output, args.workers):
+        sys.exit(1)
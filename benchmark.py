@@ -0,0 +1,247 @@
+'''
+Benchmarks every stage of a run, from building the hamiltonian to scoring
+the samples, over a grid of problem sizes with fixed seeds. The model sizes
+and the valid rate and best U of the samples are recorded too, the compact
+position encodings run next to one-hot.
+Only local samplers are used. Results are saved as JSON and can be
+compared against a saved baseline, slowdowns beyond the threshold are
+flagged and make the script exit with status 1.
+'''
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import tracemalloc
+import dimod
+import neal
+import numpy as np
+from pathlib import Path
+from timeit import default_timer as timer
+
+from chainsolver import ChainDecompositionSolver
+from conformation import ConformationBatch
+from dwavesolver import DwaveSolver, sample_repetition
+from localsearch import LocalSearchSolver
+from multiresolution import MultiresolutionSolver
+from paralleltempering import ParallelTemperingSampler
+from positionencoding import ENCODINGS
+
+SIZES = [[3, 3], [4, 3], [4, 4], [5, 5]]
+DENSE_LIMIT = 2000          # largest B * N the dense stages run for
+SEED = 1234
+CHAIN_WINDOW = 2            # atoms per window, the QBSolv sub-problems get as many variables
+PT_REPLICAS, PT_SWEEPS = 16, 500     # sim_anneal gets as many reads and sweeps
+MIN_TIME = 1e-3             # timings below this are too noisy to compare
+BENCHMARK_DIR = Path.joinpath(Path(__file__).parents[0], 'results/benchmarks')
+
+
+def make_stages(B, L):
+    """
+    The stages for one problem size in pipeline order, as (name, function)
+    pairs. Every function takes a dict of the earlier stages' outputs
+    """
+    solver = DwaveSolver(B, L)
+    chain = ChainDecompositionSolver(B, L)
+    multires = MultiresolutionSolver(B, L)
+    coarse = multires.level_problem((L + 1) // 2)
+    local_sampler = {'verbosity': -1, 'solver': neal.SimulatedAnnealingSampler()}
+    dense = B * L ** 3 <= DENSE_LIMIT
+
+    stages = []
+    if dense:
+        stages += [
+            ('constraint_Q', lambda done: solver.constraint_Q(scale=True)),
+            ('objective_Q', lambda done: solver.objective_Q(scale=True)),
+            ('from_numpy_matrix', lambda done: dimod.BinaryQuadraticModel.from_numpy_matrix(
+                solver.A * done['constraint_Q'] + solver.B * done['objective_Q'])),
+        ]
+    stages += [
+        ('potential_tables', lambda done: DwaveSolver(B, L).cell_pair_tables()),
+        ('make_coo', lambda done: solver.make_coo()),
+        ('make_bqm', lambda done: solver.make_bqm()),
+        ('sample_tabu', lambda done: sample_repetition(
+            done['make_bqm'], {'verbosity': -1, 'solver': 'tabu'}, SEED)[0]),
+        ('sample_sim_anneal', lambda done: neal.SimulatedAnnealingSampler().sample(
+            done['make_bqm'], num_reads=100, seed=SEED)),
+        # parallel tempering against annealing the same number of states as often
+        ('sample_sim_anneal_pt_budget', lambda done: neal.SimulatedAnnealingSampler().sample(
+            done['make_bqm'], num_reads=PT_REPLICAS, num_sweeps=PT_SWEEPS, seed=SEED)),
+        ('sample_parallel_tempering', lambda done: ParallelTemperingSampler().sample(
+            done['make_bqm'], num_replicas=PT_REPLICAS, num_sweeps=PT_SWEEPS, seed=SEED)),
+        ('sample_parallel_tempering_2_workers', lambda done: ParallelTemperingSampler().sample(
+            done['make_bqm'], num_replicas=PT_REPLICAS, num_sweeps=PT_SWEEPS, workers=2, seed=SEED)),
+        # QBSolv's generic splitting against windows along the chain, same sub-problem size
+        ('sample_qbsolv_split', lambda done: sample_repetition(
+            done['make_bqm'], {'verbosity': -1, 'solver': neal.SimulatedAnnealingSampler(),
+                               'solver_limit': CHAIN_WINDOW * L ** 3}, SEED)[0]),
+        ('sample_chain_windows', lambda done: chain.descend(
+            np.random.default_rng(SEED).choice(L ** 3, B, replace=False),
+            neal.SimulatedAnnealingSampler(), CHAIN_WINDOW,
+            sampler_params={'num_reads': 20, 'seed': SEED}, rng=SEED)),
+        # a coarse lattice of the same box, then the full one around its best conformation
+        ('sample_multires_coarse', lambda done: multires.solve_level(
+            coarse, None, local_sampler, [SEED])[0]),
+        ('refine_multires', lambda done: multires.refine(
+            multires.anchor(done['sample_multires_coarse']), coarse, multires)),
+        ('make_bqm_multires_fine', lambda done: multires.make_bqm(done['refine_multires'])),
+        ('sample_multires_fine', lambda done: multires.solve_level(
+            multires, done['refine_multires'], local_sampler, [SEED])[0]),
+        ('sample_local', lambda done: LocalSearchSolver(B, L).anneal(
+            np.random.default_rng(SEED), 200)),
+        ('sample_to_x_ij_matrix', lambda done: [
+            solver.sample_to_x_ij_matrix(sample)
+            for sample in done['sample_sim_anneal'].samples()]),
+        ('sampleset_to_array', lambda done: solver.sampleset_to_array(done['sample_sim_anneal'])),
+        ('samples_to_cells', lambda done: solver.samples_to_cells(done['sampleset_to_array'])),
+        ('samples_to_positions', lambda done: solver.samples_to_positions(done['sampleset_to_array'])),
+        ('objective_value', lambda done: [
+            solver.objective_value(X.flat) for X in done['sample_to_x_ij_matrix']]),
+        ('objective_values', lambda done: solver.objective_values(done['sampleset_to_array'])),
+        ('conformation_batch', lambda done: ConformationBatch.from_samples(
+            solver, done['sampleset_to_array']).to_bytes()),
+        ('score_sim_anneal', lambda done: solver.sampleset_to_batch(done['sample_sim_anneal'])),
+        ('canonical_form', lambda done: solver.canonical_form(done['samples_to_cells'])),
+        ('score_qbsolv_split', lambda done: solver.sampleset_to_batch(done['sample_qbsolv_split'])),
+        ('score_chain_windows', lambda done: ConformationBatch.from_cells(
+            solver, done['sample_chain_windows'][0])),
+        ('score_sim_anneal_pt_budget', lambda done: solver.sampleset_to_batch(
+            done['sample_sim_anneal_pt_budget'])),
+        ('score_parallel_tempering', lambda done: solver.sampleset_to_batch(
+            done['sample_parallel_tempering'])),
+        ('score_parallel_tempering_2_workers', lambda done: solver.sampleset_to_batch(
+            done['sample_parallel_tempering_2_workers'])),
+    ]
+    # the same sampler on the compact encodings, to compare with one-hot above
+    for name in ENCODINGS:
+        encoding = solver.make_encoding(name)
+        stages += [
+            (f'make_bqm_{name}', lambda done, encoding=encoding: solver.make_encoded_bqm(encoding)),
+            (f'sample_sim_anneal_{name}', lambda done, name=name: neal.SimulatedAnnealingSampler().sample(
+                done[f'make_bqm_{name}'], num_reads=100, seed=SEED)),
+            (f'score_sim_anneal_{name}', lambda done, name=name, encoding=encoding: solver.sampleset_to_batch(
+                done[f'sample_sim_anneal_{name}'], encoding)),
+        ]
+    return stages
+
+
+def describe(output):
+    """
+    Sizes of built models and the quality of scored samples
+    """
+    if isinstance(output, dimod.BinaryQuadraticModel):
+        return {'variables': output.num_variables, 'couplings': output.num_interactions}
+    if isinstance(output, ConformationBatch):
+        best = output.best()
+        return {'valid_rate': float(output.valid.mean()), 'best_U': None if best is None else best.U}
+    return {}
+
+
+def run_stage(function, done, repeat):
+    """
+    Best time over repeat calls, then the peak traced memory of one more
+    call. Returns (output, seconds, peak bytes)
+    """
+    times = []
+    for _ in range(repeat):
+        start_time = timer()
+        output = function(done)
+        times.append(timer() - start_time)
+
+    tracemalloc.start()
+    function(done)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, min(times), peak
+
+
+def run_benchmarks(sizes, repeat=3, verbose=True):
+    results = {}
+    for [B, L] in sizes:
+        size_str = f'{B}x{L}'
+        results[size_str] = {}
+        done = {}
+        for name, function in make_stages(B, L):
+            # keep the sampler state the same for every stage run
+            np.random.seed(SEED)
+            output, seconds, peak = run_stage(function, done, repeat)
+            done[name] = output
+            results[size_str][name] = dict({'time': seconds, 'peak_bytes': peak}, **describe(output))
+            if verbose:
+                extra = ' '.join(f'{key} {value:.4g}' for key, value in describe(output).items()
+                                 if value is not None)
+                print(f'{size_str} {name:30} {seconds:10.4f} s {peak / 1024 ** 2:10.2f} MiB {extra}')
+    return {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'dimod': dimod.__version__,
+            'machine': platform.platform(),
+            'seed': SEED,
+            'repeat': repeat,
+        },
+        'results': results
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Stages that got slower, or used more memory, by more than threshold
+    (a fraction) relative to the baseline. Stages faster than MIN_TIME
+    are not timed precisely enough to be flagged.
+    Returns a list of (size, stage, measure, old, new)
+    """
+    regressions = []
+    for size_str, stages in current['results'].items():
+        for name, measures in stages.items():
+            old_measures = baseline['results'].get(size_str, {}).get(name)
+            if old_measures is None:
+                continue
+            for measure in ['time', 'peak_bytes']:
+                old, new = old_measures[measure], measures[measure]
+                if measure == 'time' and new < MIN_TIME:
+                    continue
+                if old > 0 and new > old * (1 + threshold):
+                    regressions.append((size_str, name, measure, old, new))
+    return regressions
+
+
+def parse_size(size_str):
+    return [int(n) for n in size_str.split('x')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--sizes', type=parse_size, nargs='+', default=SIZES,
+                        help='problem sizes as BxL, e.g. 4x4 5x5')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='timed runs per stage, the best is kept. Default 3')
+    parser.add_argument('-o', '--output', type=Path, default=None,
+                        help='where to save the results, default results/benchmarks/<date>.json')
+    parser.add_argument('-c', '--compare', type=Path, default=None,
+                        help='baseline JSON to compare the results against')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='flag stages more than this fraction slower. Default 0.2')
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.sizes, args.repeat)
+
+    output = args.output
+    if output is None:
+        output = Path.joinpath(BENCHMARK_DIR, datetime.datetime.now().strftime('%Y%m%d-%H%M%S.json'))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as out_file:
+        json.dump(current, out_file, indent=2)
+    print(f'saved to {output}')
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as in_file:
+            baseline = json.load(in_file)
+        regressions = compare(baseline, current, args.threshold)
+        for size_str, name, measure, old, new in regressions:
+            print(f'REGRESSION {size_str} {name} {measure}: {old:.4g} -> {new:.4g} ({new / old:.2f}x)')
+        if regressions:
+            sys.exit(1)
+        print('no regressions')
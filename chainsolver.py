@@ -0,0 +1,226 @@
+'''
+Decomposition of the hamiltonian along the chain. QBSolv cuts the QUBO into
+sub-problems of solver_limit variables without knowing what they stand for,
+here a window of consecutive atoms is solved again with every other atom
+clamped in its spot, and the window is kept if U went down.
+The sub-QUBO of a window is the one-hot constraints and the pair terms
+between its atoms, which only depend on the number of atoms in the window
+and are built once, plus linear terms from the clamped atoms gathered from
+the cached potential tables. The spots of the clamped atoms are dropped.
+Any dimod sampler solves the windows.
+'''
+
+import numpy as np
+from timeit import default_timer as timer
+
+from conformation import ConformationBatch
+from dwavesolver import DwaveSolver
+from instrumentation import NULL_INSTRUMENT
+
+# constants the hamiltonian of a window depends on
+CONSTANTS = ['A', 'B', 'CELL_LENGTH', 'SIGMA', 'e', 'bond_length', 'BETA', 'CUTOFF', 'CUTOFF_SHIFT']
+
+
+class ChainDecompositionSolver(DwaveSolver):
+    def set_hyper_parameters(self):
+        super().set_hyper_parameters()
+        self.WINDOW = 2                 # atoms solved at once
+        self.ROUNDS = 20                # at most this many passes over the chain
+
+    def window_coo(self, size):
+        """
+        (rows, cols, values) of the constraints and the pair terms of size
+        consecutive atoms in the ij_to_q order of a problem of size atoms,
+        with duplicates summed and scaled like the full hamiltonian
+        """
+        self.potential_tables()
+        key = (size, self._potential_tables_key, self.A, self.B)
+        if getattr(self, '_window_coo_key', {}).get(size) != key:
+            window = DwaveSolver(size, self.LATTICE_LENGTH)
+            for name in CONSTANTS:
+                setattr(window, name, getattr(self, name))
+            c_rows, c_cols, c_values = window.constraint_coo(scale=True)
+            o_rows, o_cols, o_values = window.objective_coo()
+            rows = np.concatenate([c_rows, o_rows])
+            cols = np.concatenate([c_cols, o_cols])
+            values = np.concatenate([self.A * c_values, self.B * o_values / self.objective_scale()])
+
+            N = size * self.N_CELLS
+            keys, inverse = np.unique(rows.astype(np.int64) * N + cols, return_inverse=True)
+            values = np.bincount(inverse.ravel(), weights=values, minlength=len(keys))
+            if not hasattr(self, '_window_coo'):
+                self._window_coo, self._window_coo_key = {}, {}
+            self._window_coo[size] = (keys // N, keys % N, values)
+            self._window_coo_key[size] = key
+        return self._window_coo[size]
+
+    def window_bqm(self, cells, start, size, lj_total):
+        """
+        The sub-QUBO of atoms start .. start + size - 1 with the others
+        clamped in cells, atom start + i is atom i of it. lj_total is the
+        LJ of all atoms with every spot, lj[cells].sum(axis=0)
+        """
+        lj, bond = self.cell_pair_tables()
+        window = np.arange(start, start + size)
+        free = np.ones(self.N_CELLS, dtype=bool)
+        free[np.delete(cells, window)] = False
+        spots = np.flatnonzero(free)
+
+        # the clamped atoms act on every spot of the window atoms,
+        # bonded to the atoms on either side of it and LJ with the rest
+        fields = np.repeat((lj_total - lj[cells[window]].sum(axis=0))[None, :], size, axis=0)
+        for i, k in [(0, start - 1), (size - 1, start + size)]:
+            if 0 <= k < self.N_ATOMS:
+                fields[i] += bond[:, cells[k]] - lj[:, cells[k]]
+        fields *= 2 * self.B / self.objective_scale()
+
+        rows, cols, values = self.window_coo(size)
+        kept = free[rows % self.N_CELLS] & free[cols % self.N_CELLS]
+        q = (np.arange(size)[:, None] * self.N_CELLS + spots).ravel()
+        coo = (
+            np.concatenate([rows[kept], q]),
+            np.concatenate([cols[kept], q]),
+            np.concatenate([values[kept], fields[:, spots].ravel()]),
+        )
+        return self.coo_to_bqm(coo, [spots] * size)
+
+    def solve_window(self, cells, start, size, lj_total, sampler, sampler_params):
+        """
+        Samples one window. Returns the spots of its atoms in the lowest
+        energy sample, None if that sample is not one spot per atom
+        """
+        bqm = self.window_bqm(cells, start, size, lj_total)
+        response = sampler.sample(bqm, **sampler_params)
+        sample = response.first.sample
+        X = np.zeros(size * self.N_CELLS, dtype=np.int8)
+        X[np.fromiter(sample.keys(), dtype=int, count=len(sample))] = list(sample.values())
+        X = X.reshape(size, self.N_CELLS)
+        if (X.sum(axis=1) != 1).any():
+            return None
+        return X.argmax(axis=1)
+
+    def window_starts(self, size, schedule, rng):
+        """
+        The first atoms of the windows of one pass, 'slide' steps through
+        the chain one atom at a time and 'random' picks as many at random
+        """
+        starts = np.arange(self.N_ATOMS - size + 1)
+        if schedule == 'random':
+            return rng.integers(0, len(starts), len(starts))
+        return starts
+
+    def descend(self, cells, sampler, size, schedule='slide', rounds=None,
+                sampler_params=None, rng=None, instrument=NULL_INSTRUMENT):
+        """
+        Solves windows of size atoms, starting from cells (one spot per
+        atom, all different), until a pass over the chain changes nothing
+        or after rounds passes. Returns (cells, U, windows solved)
+        """
+        rounds = self.ROUNDS if rounds is None else rounds
+        sampler_params = sampler_params or {}
+        rng = np.random.default_rng(rng)
+        lj, _ = self.cell_pair_tables()
+        cells = np.array(cells)
+        U = self.objective_values(cells[None, :])[0][0]
+        lj_total = lj[cells].sum(axis=0)
+
+        solved = 0
+        for _ in range(rounds):
+            improved = False
+            for start in self.window_starts(size, schedule, rng):
+                window = slice(start, start + size)
+                with instrument.span('window'):
+                    spots = self.solve_window(cells, start, size, lj_total, sampler, sampler_params)
+                solved += 1
+                if spots is None or len(np.unique(spots)) < size:
+                    continue
+                candidate = cells.copy()
+                candidate[window] = spots
+                candidate_U = self.objective_values(candidate[None, :])[0][0]
+                if candidate_U < U:
+                    lj_total += lj[spots].sum(axis=0) - lj[cells[window]].sum(axis=0)
+                    cells, U = candidate, candidate_U
+                    improved = True
+            if not improved:
+                break
+        return cells, U, solved
+
+    def solve(self, options):
+        """
+        Options:
+            'solver' - dimod sampler for the windows, default
+                neal.SimulatedAnnealingSampler()
+            'sampler_params' - dict of keyword arguments to its sample,
+                default 20 reads if it takes num_reads
+            'window' - int, atoms in a window, default WINDOW
+            'schedule' - 'slide' (default) or 'random', see window_starts
+            'rounds' - int, most passes over the chain, default ROUNDS
+            'repititions' - int, descents from random placements, default 5
+            'top_samples' - int, how many results to print
+            'visualize' - boolean,
+            'seed' - int, default None
+            'instrument' - Instrument that records stage timings and
+                counters, default records nothing
+        Returns a ConformationBatch of the repetitions, lowest U first
+        """
+        DEFAULT_OPTIONS = {
+            'solver': None,
+            'sampler_params': None,
+            'window': self.WINDOW,
+            'schedule': 'slide',
+            'rounds': self.ROUNDS,
+            'repititions': 5,
+            'top_samples': 1,
+            'visualize': False,
+            'verbosity': 0,
+            'seed': None,
+            'no_time': False,
+            'instrument': NULL_INSTRUMENT
+        }
+        complete_options = DEFAULT_OPTIONS.copy()
+        complete_options.update(options)
+        instrument = complete_options['instrument']
+
+        sampler = complete_options['solver']
+        sampler_params = complete_options['sampler_params']
+        if sampler is None or isinstance(sampler, str):
+            import neal
+            sampler = neal.SimulatedAnnealingSampler()
+        if sampler_params is None:
+            sampler_params = {'num_reads': 20} if 'num_reads' in sampler.parameters else {}
+        size = min(complete_options['window'], self.N_ATOMS)
+        print(f'windows of {size} atoms, at most {size * self.N_CELLS} variables')
+
+        rng = np.random.default_rng(complete_options['seed'])
+        found, found_U = [], []
+        total_time = 0
+        for _ in range(complete_options['repititions']):
+            start_time = timer()
+            cells, U, solved = self.descend(
+                rng.choice(self.N_CELLS, self.N_ATOMS, replace=False), sampler, size,
+                complete_options['schedule'], complete_options['rounds'],
+                sampler_params, rng, instrument
+            )
+            solve_time = timer() - start_time
+            total_time += solve_time
+            found.append(cells)
+            found_U.append(U)
+            instrument.timing('sample', solve_time)
+            instrument.count('windows', solved)
+            if not complete_options['no_time']:
+                print(f'time to solve: {solve_time} s ({solved} windows)')
+
+        # every window kept has one spot per atom, all different
+        results = ConformationBatch(found, self.LATTICE_LENGTH, U=found_U,
+                                    solver=f'chain_{type(sampler).__name__}').sorted()
+        for sample_i, conformation in enumerate(results[:complete_options['top_samples']]):
+            print(f'------- sample {sample_i} -------')
+            print('solution is valid:', conformation.valid)
+            print('total U:', conformation.U)
+
+            if complete_options['visualize']:
+                self.plot_3d(self.cells_to_positions(conformation.cells))
+
+        if not complete_options['no_time']:
+            print(f'average time: {total_time / complete_options["repititions"]} s')
+        return results
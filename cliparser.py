@@ -1,5 +1,10 @@
 import argparse
 
+from solvers import SOLVERS
+
+# the names of positionencoding.ENCODINGS, which would pull in NumPy here
+ENCODINGS = ['binary', 'domain_wall']
+
 parser = argparse.ArgumentParser(
     description="""Try to find a good solution for a molecular conformation
         problem using d-wave utilities and a variety of solvers."""
@@ -21,7 +26,7 @@ parser.add_argument(
     '-s', '--solver',
     type=str,
     default='tabu',
-    choices=['tabu', 'hybrid', 'embed', 'sim_anneal', 'cplex', 'qiskit'],
+    choices=list(SOLVERS),
     help='which solver to use. Default "tabu"'
 )
 parser.add_argument(
@@ -50,3 +55,93 @@ parser.add_argument(
     help='optional flag, if included the length of time to solve will not be printed',
     required=False
 )
+parser.add_argument(
+    '-w', '--workers',
+    type=int,
+    help='How many processes to run the repetitions (tabu, sim_anneal) or the search (exact) in. Default 1',
+    default=1
+)
+parser.add_argument(
+    '--seed',
+    type=int,
+    help='Base random seed, every repetition gets its own seed derived from it.',
+    default=None
+)
+parser.add_argument(
+    '-c', '--cutoff',
+    type=float,
+    help='LJ cutoff radius in Angstrom, further pairs are dropped from the hamiltonian. Default none',
+    default=None
+)
+parser.add_argument(
+    '--cutoff-shift',
+    dest='cutoff_shift',
+    action='store_true',
+    help='optional flag, if included the LJ potential is shifted to be 0 at the cutoff',
+    required=False
+)
+parser.add_argument(
+    '--prune',
+    dest='prune',
+    action='store_true',
+    help='optional flag, if included atom 0 is fixed to a canonical region and spots out of bond reach are dropped',
+    required=False
+)
+parser.add_argument(
+    '--cache',
+    dest='cache',
+    action='store_true',
+    help='optional flag, if included built hamiltonians are reused from results/qubo_cache',
+    required=False
+)
+parser.add_argument(
+    '--encoding',
+    type=str,
+    default='one_hot',
+    choices=['one_hot'] + ENCODINGS,
+    help='how the spot of an atom is encoded in binary variables (tabu, sim_anneal, hybrid, embed). Default "one_hot"'
+)
+parser.add_argument(
+    '--target-U',
+    dest='target_U',
+    type=float,
+    help='report the sampling time until a valid conformation with at most this U is found. Default none',
+    default=None
+)
+parser.add_argument(
+    '--replicas',
+    type=int,
+    help='temperatures of parallel_tempering. Default 32',
+    default=32
+)
+parser.add_argument(
+    '--sweeps',
+    type=int,
+    help='sweeps of every parallel_tempering repetition. Default 1000',
+    default=1000
+)
+parser.add_argument(
+    '--window',
+    type=int,
+    help='consecutive atoms solved at once by the chain solver, the others stay in place. Default 2',
+    default=None
+)
+parser.add_argument(
+    '--levels',
+    type=int,
+    nargs='+',
+    help='lattice lengths the multires solver goes through, coarse to fine. Default halving -L down to 3',
+    default=None
+)
+parser.add_argument(
+    '--radius',
+    type=float,
+    help='how far in fine cells the multires solver moves an atom from its coarser spot. Default one coarse cell',
+    default=None
+)
+parser.add_argument(
+    '--profile',
+    type=str,
+    help='JSON lines file to append stage timings, counters and peak memory to. Default none',
+    default=None
+)
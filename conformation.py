@@ -0,0 +1,339 @@
+'''
+Compact containers for solutions. A conformation is kept as the spot of
+every atom, B small integers, instead of the B * N 0-1 vector the
+hamiltonian works on. A ConformationBatch holds many of them as columns of
+NumPy arrays, so millions of candidates fit in memory, and has a compact
+binary form for saving them.
+'''
+
+import json
+import struct
+import numpy as np
+
+from instrumentation import NULL_INSTRUMENT
+
+MAGIC = b'CONF'
+FORMAT_VERSION = 1
+# magic, version, n_atoms, lattice_length, size, cells dtype, length of the solver names
+HEADER = struct.Struct('<4sBIIQ2sI')
+
+
+def cell_dtype(n_cells):
+    """
+    Smallest signed integer type holding every spot and -1 for no spot
+    """
+    for dtype in [np.int8, np.int16, np.int32]:
+        if n_cells - 1 <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def cells_valid(cells):
+    """
+    For an (S, B) array of spots, whether every atom has a spot of its own
+    """
+    cells = np.sort(np.atleast_2d(cells), axis=1)
+    return (cells[:, 0] >= 0) & (np.diff(cells, axis=1) != 0).all(axis=1)
+
+
+def cells_to_samples(cells, n_cells):
+    """
+    The (S, B * N) 0-1 vectors in ij_to_q order of an (S, B) array of
+    spots, atoms in no spot (-1) have no 1
+    """
+    cells = np.atleast_2d(cells)
+    [n_samples, n_atoms] = cells.shape
+    samples = np.zeros((n_samples, n_atoms * n_cells), dtype=np.int8)
+    [s, i] = np.nonzero(cells >= 0)
+    samples[s, i * n_cells + cells[s, i]] = 1
+    return samples
+
+
+class Conformation:
+    """
+    The spot of every atom of one conformation. energy is the energy of the
+    hamiltonian reported by the solver and U the potential energy, both NaN
+    if unknown. valid is whether it fulfills the constraints
+    """
+    __slots__ = ['cells', 'lattice_length', 'energy', 'U', 'valid', 'solver']
+
+    def __init__(self, cells, lattice_length, energy=np.nan, U=np.nan, valid=None, solver=None):
+        self.cells = np.asarray(cells, dtype=cell_dtype(lattice_length ** 3))
+        self.lattice_length = lattice_length
+        self.energy = float(energy)
+        self.U = float(U)
+        self.valid = bool(cells_valid(self.cells)[0] if valid is None else valid)
+        self.solver = solver
+
+    @classmethod
+    def from_solution(cls, problem, solution, energy=np.nan, solver=None):
+        """
+        Decodes and scores a 0-1 vector or {q: 0|1} dict of a MolecularConformation
+        """
+        if isinstance(solution, dict):
+            solution = problem.sample_to_array(solution)
+        return ConformationBatch.from_samples(problem, [solution], [energy], solver)[0]
+
+    @property
+    def n_atoms(self):
+        return len(self.cells)
+
+    @property
+    def n_cells(self):
+        return self.lattice_length ** 3
+
+    def to_solution(self):
+        """
+        The 0-1 vector in ij_to_q order
+        """
+        return cells_to_samples(self.cells, self.n_cells)[0]
+
+    def to_bytes(self):
+        return ConformationBatch.from_conformations([self]).to_bytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return ConformationBatch.from_bytes(data)[0]
+
+    def __eq__(self, other):
+        return (isinstance(other, Conformation) and self.lattice_length == other.lattice_length
+                and np.array_equal(self.cells, other.cells))
+
+    def __hash__(self):
+        return hash((self.lattice_length, self.cells.tobytes()))
+
+    def __repr__(self):
+        return (f'Conformation({self.cells.tolist()}, {self.lattice_length}, energy={self.energy},'
+                f' U={self.U}, valid={self.valid}, solver={self.solver!r})')
+
+
+class ConformationBatch:
+    """
+    Many conformations of the same problem size in columns: cells (S, B),
+    energy (S,), U (S,), valid (S,) and the solver of every row, kept as
+    indices into solver_names. Indexing with an int gives a Conformation,
+    with a slice, mask or index array a ConformationBatch
+    """
+    __slots__ = ['cells', 'lattice_length', 'energy', 'U', 'valid', 'solver_codes', 'solver_names']
+
+    def __init__(self, cells, lattice_length, energy=None, U=None, valid=None, solver=None):
+        """
+        solver is one name for every row, a name per row or None
+        """
+        cells = np.asarray(cells, dtype=cell_dtype(lattice_length ** 3))
+        self.cells = cells if cells.ndim == 2 else cells.reshape(len(cells), -1)
+        self.lattice_length = lattice_length
+        size = len(self.cells)
+        self.energy = np.full(size, np.nan) if energy is None else np.asarray(energy, dtype=float)
+        self.U = np.full(size, np.nan) if U is None else np.asarray(U, dtype=float)
+        self.valid = cells_valid(self.cells) if valid is None else np.asarray(valid, dtype=bool)
+
+        if solver is None or isinstance(solver, str):
+            self.solver_names = [solver]
+            self.solver_codes = np.zeros(size, dtype=np.uint16)
+        else:
+            # names as they are, None stays None
+            solver = list(solver)
+            self.solver_names = sorted(set(solver), key=str)
+            codes = {name: code for code, name in enumerate(self.solver_names)}
+            self.solver_codes = np.array([codes[name] for name in solver], dtype=np.uint16)
+
+    @classmethod
+    def _from_columns(cls, cells, lattice_length, energy, U, valid, solver_codes, solver_names):
+        batch = cls.__new__(cls)
+        batch.cells = cells
+        batch.lattice_length = lattice_length
+        batch.energy = energy
+        batch.U = U
+        batch.valid = valid
+        batch.solver_codes = solver_codes
+        batch.solver_names = solver_names
+        return batch
+
+    @classmethod
+    def from_samples(cls, problem, samples, energy=None, solver=None, instrument=NULL_INSTRUMENT):
+        """
+        Decodes and scores the samples of a MolecularConformation, a
+        SampleSet or an (S, B * N) 0-1 array in ij_to_q order.
+        The energies of a SampleSet are kept unless energy is given.
+        The two steps are timed as the decode and score spans of instrument
+        """
+        with instrument.span('decode'):
+            if hasattr(samples, 'record'):
+                if energy is None:
+                    energy = samples.record.energy
+                samples = problem.sampleset_to_array(samples)
+            samples = np.asarray(samples)
+            cells = problem.samples_to_cells(samples)
+        with instrument.span('score'):
+            U, violations = problem.objective_values(samples)
+        return cls(cells, problem.LATTICE_LENGTH, energy, U, violations == 0, solver)
+
+    @classmethod
+    def from_cells(cls, problem, cells, energy=None, solver=None):
+        """
+        Scores an (S, B) array of spots of a MolecularConformation,
+        rows with atoms in no spot (-1) are scored as 0-1 vectors
+        """
+        cells = np.atleast_2d(cells)
+        placed = (cells >= 0).all(axis=1)
+        U, violations = np.zeros(len(cells)), np.zeros(len(cells))
+        if placed.any():
+            U[placed], violations[placed] = problem.objective_values(cells[placed])
+        if not placed.all():
+            U[~placed], violations[~placed] = problem.objective_values(
+                cells_to_samples(cells[~placed], problem.N_CELLS))
+        return cls(cells, problem.LATTICE_LENGTH, energy, U, violations == 0, solver)
+
+    @classmethod
+    def from_conformations(cls, conformations, lattice_length=0):
+        """
+        One batch of Conformations of the same problem size, an empty
+        batch on a lattice of lattice_length if there are none
+        """
+        conformations = list(conformations)
+        if not conformations:
+            return cls(np.zeros((0, 0), dtype=int), lattice_length, valid=[])
+        return cls(
+            [c.cells for c in conformations], conformations[0].lattice_length,
+            [c.energy for c in conformations], [c.U for c in conformations],
+            [c.valid for c in conformations], [c.solver for c in conformations]
+        )
+
+    @classmethod
+    def concatenate(cls, batches):
+        """
+        One batch of every row of batches, all of the same problem size
+        """
+        batches = list(batches)
+        names = sorted({name for batch in batches for name in batch.solver_names}, key=str)
+        codes = [
+            np.array([names.index(name) for name in batch.solver_names], dtype=np.uint16)[batch.solver_codes]
+            for batch in batches
+        ]
+        return cls._from_columns(
+            np.concatenate([batch.cells for batch in batches]), batches[0].lattice_length,
+            np.concatenate([batch.energy for batch in batches]),
+            np.concatenate([batch.U for batch in batches]),
+            np.concatenate([batch.valid for batch in batches]),
+            np.concatenate(codes), names
+        )
+
+    @property
+    def n_atoms(self):
+        return self.cells.shape[1]
+
+    @property
+    def n_cells(self):
+        return self.lattice_length ** 3
+
+    @property
+    def solver(self):
+        """
+        The solver name of every row
+        """
+        return np.array(self.solver_names, dtype=object)[self.solver_codes]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in
+                   ['cells', 'energy', 'U', 'valid', 'solver_codes'])
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Conformation(
+                self.cells[index], self.lattice_length, self.energy[index], self.U[index],
+                self.valid[index], self.solver_names[self.solver_codes[index]]
+            )
+        return self._from_columns(
+            self.cells[index], self.lattice_length, self.energy[index], self.U[index],
+            self.valid[index], self.solver_codes[index], self.solver_names
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def sorted(self, by='U'):
+        """
+        The batch ordered by the column by, 'U' or 'energy', lowest first
+        and unknown (NaN) last
+        """
+        return self[np.argsort(getattr(self, by), kind='stable')]
+
+    def best(self, by='U'):
+        """
+        The valid conformation lowest in the column by, None if there is none
+        """
+        valid = self[self.valid]
+        if len(valid) == 0:
+            return None
+        return valid[int(np.argsort(getattr(valid, by), kind='stable')[0])]
+
+    def distinct(self, problem, by='U'):
+        """
+        Groups the rows that are a symmetry of each other (see
+        canonical_form of problem). Returns the row lowest in the column
+        by of every group, lowest first, and how many rows each group has
+        """
+        order = np.argsort(getattr(self, by), kind='stable')
+        canonical = problem.canonical_form(self.cells[order])
+        _, first, counts = np.unique(canonical, axis=0, return_index=True, return_counts=True)
+        lowest = np.argsort(first, kind='stable')
+        return self[order[first[lowest]]], counts[lowest]
+
+    def to_samples(self):
+        """
+        The (S, B * N) 0-1 vectors in ij_to_q order
+        """
+        return cells_to_samples(self.cells, self.n_cells)
+
+    def to_bytes(self):
+        """
+        A header followed by the raw columns, validity packed into bits
+        """
+        names = json.dumps(self.solver_names).encode()
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, self.n_atoms, self.lattice_length,
+                             len(self), self.cells.dtype.str[1:].encode(), len(names))
+        return b''.join([
+            header, names,
+            self.cells.astype(self.cells.dtype.newbyteorder('<')).tobytes(),
+            self.energy.astype('<f8').tobytes(),
+            self.U.astype('<f8').tobytes(),
+            np.packbits(self.valid).tobytes(),
+            self.solver_codes.astype('<u2').tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        [magic, version, n_atoms, lattice_length, size, dtype, names_length] = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('not a conformation batch of format version', FORMAT_VERSION)
+        offset = HEADER.size
+        names = json.loads(data[offset:offset + names_length])
+        offset += names_length
+
+        columns = []
+        for dtype, count in [('<' + dtype.decode(), size * n_atoms), ('<f8', size), ('<f8', size),
+                             ('u1', (size + 7) // 8), ('<u2', size)]:
+            column = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += column.nbytes
+            columns.append(column)
+        [cells, energy, U, valid, solver_codes] = columns
+        return cls._from_columns(
+            cells.reshape(size, n_atoms).copy(), lattice_length, energy.copy(), U.copy(),
+            np.unpackbits(valid, count=size).astype(bool), solver_codes.astype(np.uint16), names
+        )
+
+    def save(self, file_path):
+        with open(file_path, 'wb') as out_file:
+            out_file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, 'rb') as in_file:
+            return cls.from_bytes(in_file.read())
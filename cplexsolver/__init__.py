@@ -1,48 +1,85 @@
-import os
+import numpy as np
 from pathlib import Path
-from pyomo.environ import *
-from pyomo.opt.base import ProblemFormat
 import xml.etree.ElementTree as ET
 
+from conformation import Conformation
 from lpwriter import LpWriter
-from .NeosClient import main as send_to_neos
+from .asyncneos import NEOS_SERVER, run_jobs
 
 
 class CplexNeosSolver(LpWriter):
     def set_hyper_parameters(self):
         cwd = Path(__file__).parents[0]
-        self.LP_FILEPATH = Path.joinpath(cwd, 'model.lp')
         self.XML_TEMPLATE_FILEPATH = Path.joinpath(cwd, 'template.xml')
-        self.XML_FILEPATH = Path.joinpath(cwd, 'problem.xml')
 
-    def write_xml(self):
+    def make_xml(self):
+        """
+        The NEOS job XML of this problem, with the LP written straight
+        into it in memory so that any number of jobs can be made at once
+        """
         if self.N_ATOMS * self.N_CELLS < 120:
             priority = 'short'
         else:
             priority = 'long'
 
-        with open(self.LP_FILEPATH, 'r') as lp_file:
-            xml = ET.parse(self.XML_TEMPLATE_FILEPATH)
-            root = xml.getroot()
-            LP = root.find('.//LP').text = lp_file.read()
-            root.find('.//priority').text = priority
-            xml.write(self.XML_FILEPATH)
+        root = ET.parse(self.XML_TEMPLATE_FILEPATH).getroot()
+        root.find('.//LP').text = self.model_text()
+        root.find('.//priority').text = priority
+        return ET.tostring(root, encoding='unicode')
 
-    def cleanup(self):
-        os.remove(self.LP_FILEPATH)
-        os.remove(self.XML_FILEPATH)
+    def result_to_conformation(self, result):
+        """
+        The scored Conformation of a NeosResult, None if it has no solution
+        """
+        if result.indices is None:
+            return None
+        solution = np.zeros(self.N_ATOMS * self.N_CELLS, dtype=np.int8)
+        solution[result.indices] = 1
+        energy = np.nan if result.objective is None else result.objective
+        return Conformation.from_solution(self, solution, energy, 'cplex')
+
+    def solve(self, options=None):
+        """
+        Options:
+            'server' - XML-RPC url of NEOS, default the real one
+            'verbosity' - int, below 1 the solver output is not printed
+            'compress' - boolean, gzip the requests, the server has to
+                accept Content-Encoding: gzip. Default False
+        Returns the NeosResult
+        """
+        complete_options = {'server': NEOS_SERVER, 'verbosity': 1, 'compress': False}
+        complete_options.update(options or {})
 
-    def solve(self):
-        print('creating model...', end='')
-        self.write_model()
-        print(' DONE')
         print('creating XML...', end='')
-        self.write_xml()
+        xml = self.make_xml()
         print(' DONE')
         print('sending to NEOS server...')
-        print('(It should be safe to force quit once "BEGIN SOLVER OUTPUT" appears)')
-        send_to_neos(self.XML_FILEPATH)
-        print(' DONE')
-        print('cleaning up...', end='')
-        self.cleanup()
+        on_output = None
+        if complete_options['verbosity'] > 0:
+            on_output = lambda name, text: print(text, end='')
+        result = run_jobs({'model': xml}, on_output, server=complete_options['server'],
+                          compress=complete_options['compress'])['model']
+        if isinstance(result, Exception):
+            raise result
+
+        conformation = self.result_to_conformation(result)
+        if conformation is not None:
+            print('solution is valid:', conformation.valid)
+            print('total U:', conformation.U)
         print(' COMPLETE')
+        return result
+
+
+def solve_sizes(sizes, on_output=None, **kwargs):
+    """
+    Solves every [B, L] of sizes on NEOS at the same time, kwargs go to
+    AsyncNeosClient. Returns {(B, L): Conformation}, None for jobs without
+    a solution and the exception for jobs that failed
+    """
+    solvers = {(B, L): CplexNeosSolver(B, L) for [B, L] in sizes}
+    xmls = {size: solver.make_xml() for size, solver in solvers.items()}
+    results = run_jobs(xmls, on_output, **kwargs)
+    return {
+        size: result if isinstance(result, Exception) else solvers[size].result_to_conformation(result)
+        for size, result in results.items()
+    }
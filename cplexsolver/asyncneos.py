@@ -0,0 +1,150 @@
+'''
+Asynchronous NEOS client. Any number of jobs are submitted and polled at
+once, each in its own coroutine, so a sweep takes as long as its slowest job.
+Polling backs off from poll_interval to max_interval, intermediate output is
+handed to a callback per job and the final output is parsed into a
+NeosResult instead of being printed.
+The XML-RPC calls block so they run in worker threads, every job has its
+own connection.
+'''
+
+import asyncio
+import os
+import xmlrpc.client
+from collections import namedtuple
+from functools import partial
+
+from resultstore import parse_cplex_log
+
+NEOS_SERVER = 'https://neos-server.org:3333'
+
+# objective and indices are None if the output has no final solution,
+# indices are the binary variables that are 1 (see resultstore.parse_cplex_log)
+NeosResult = namedtuple('NeosResult', ['name', 'job_number', 'output', 'objective', 'indices'])
+
+
+class NeosError(Exception):
+    pass
+
+
+class AsyncNeosClient:
+    def __init__(self, server=NEOS_SERVER, username=None, password=None,
+                 poll_interval=1.0, max_interval=30.0, backoff=1.5, max_jobs=8,
+                 compress=False):
+        """
+        username and password default to NEOS_USERNAME and NEOS_PASSWORD
+        from the environment when the client is made.
+        max_jobs is how many jobs are on the server at the same time.
+        With compress the requests, mostly the job XML, are sent gzipped,
+        the server has to accept Content-Encoding: gzip
+        """
+        self.server = server
+        self.username = username if username is not None else os.environ.get('NEOS_USERNAME')
+        self.password = password if password is not None else os.environ.get('NEOS_PASSWORD')
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_jobs = max_jobs
+        self.compress = compress
+
+    def connect(self):
+        transport = None
+        if self.compress:
+            if self.server.startswith('https'):
+                transport = xmlrpc.client.SafeTransport()
+            else:
+                transport = xmlrpc.client.Transport()
+            transport.encode_threshold = 0
+        return xmlrpc.client.ServerProxy(self.server, transport=transport, allow_none=True)
+
+    async def call(self, neos, method, *args):
+        # the default thread pool of the loop
+        return await asyncio.get_event_loop().run_in_executor(None, partial(getattr(neos, method), *args))
+
+    async def ping(self, neos=None):
+        """
+        Raises NeosError if the server is not alive
+        """
+        alive = await self.call(neos or self.connect(), 'ping')
+        if alive != 'NeosServer is alive\n':
+            raise NeosError('Could not make connection to NEOS Server', self.server)
+
+    async def submit(self, neos, xml):
+        """
+        Returns (job number, job password)
+        """
+        if self.username and self.password:
+            [job_number, password] = await self.call(
+                neos, 'authenticatedSubmitJob', xml, self.username, self.password)
+        else:
+            [job_number, password] = await self.call(neos, 'submitJob', xml)
+        if job_number == 0:
+            # the password is the error message then
+            raise NeosError('NEOS Server error', password)
+        return job_number, password
+
+    async def run_job(self, xml, name=None, on_output=None):
+        """
+        Submits the job XML, waits for it to finish and returns its
+        NeosResult. on_output(name, text) is called with every piece of
+        intermediate output, if the server has any
+        """
+        neos = self.connect()
+        await self.ping(neos)
+        [job_number, password] = await self.submit(neos, xml)
+        if on_output is not None:
+            on_output(name, f'Job number = {job_number}\n')
+
+        offset = 0
+        streaming = on_output is not None
+        interval = self.poll_interval
+        while True:
+            await asyncio.sleep(interval)
+            interval = min(interval * self.backoff, self.max_interval)
+            if streaming:
+                try:
+                    [message, offset] = await self.call(
+                        neos, 'getIntermediateResults', job_number, password, offset)
+                    on_output(name, message.data.decode())
+                except xmlrpc.client.Fault:
+                    streaming = False   # not every server has it
+            status = await self.call(neos, 'getJobStatus', job_number, password)
+            if status == 'Done':
+                break
+            if status in ['Unknown Job', 'Bad Password']:
+                raise NeosError(f'job {job_number}', status)
+
+        output = (await self.call(neos, 'getFinalResults', job_number, password)).data.decode()
+        if on_output is not None:
+            on_output(name, output)
+        parsed = parse_cplex_log(output)
+        [objective, indices] = parsed if parsed is not None else [None, None]
+        return NeosResult(name, job_number, output, objective, indices)
+
+    async def run_jobs(self, xmls, on_output=None):
+        """
+        Runs every job of xmls, a dict {name: job XML}, at most max_jobs
+        at a time. Returns {name: NeosResult}, or the exception for the
+        jobs that failed, once all are done
+        """
+        slots = asyncio.Semaphore(self.max_jobs)
+
+        async def run(name, xml):
+            async with slots:
+                return await self.run_job(xml, name, on_output)
+
+        names = list(xmls)
+        results = await asyncio.gather(
+            *(run(name, xmls[name]) for name in names), return_exceptions=True)
+        return dict(zip(names, results))
+
+
+def run_jobs(xmls, on_output=None, **kwargs):
+    """
+    Blocking AsyncNeosClient(**kwargs).run_jobs(xmls, on_output)
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(AsyncNeosClient(**kwargs).run_jobs(xmls, on_output))
+    finally:
+        loop.close()
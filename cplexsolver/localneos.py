@@ -0,0 +1,124 @@
+'''
+Local stand-in for the NEOS XML-RPC interface, to run AsyncNeosClient and
+CplexNeosSolver without the real server. It implements ping, submitJob,
+getJobStatus, getIntermediateResults and getFinalResults. Every job sleeps
+for duration seconds and then runs solve on its XML in its own thread.
+The default solve reads the problem size from the LP, anneals it with
+LocalSearchSolver and answers in the format of CPLEX, so the output parses
+like that of the real server.
+'''
+
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+import xmlrpc.client
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer
+
+
+def solve_locally(xml):
+    """
+    Anneals the LP of LpWriter in the job XML, returns CPLEX like output
+    """
+    import numpy as np
+    from localsearch import LocalSearchSolver
+
+    lp = ET.fromstring(xml).find('.//LP').text
+    n_atoms = len(re.findall(r'^c_e_InOneSpotCon\(', lp, re.M))
+    n_cells = len(re.findall(r'^c_u_AtMostOneAtomCon\(', lp, re.M))
+    solver = LocalSearchSolver(n_atoms, round(n_cells ** (1 / 3)))
+    cells, U, _ = solver.anneal(np.random.default_rng(0), solver.SWEEPS)
+
+    lines = [f'Local stand-in: {n_atoms} atoms, {n_cells} spots',
+             f'MIP - Integer feasible:  Objective =  {U:.10e}',
+             'CPLEX> Incumbent solution',
+             'Variable Name           Solution Value']
+    lines += [f'x{q + 1:<28d}1.000000' for q in sorted(solver.ij_to_q(np.arange(n_atoms), cells))]
+    lines.append(f'All other variables in the range 1-{n_atoms * n_cells} are 0.')
+    return '\n'.join(lines) + '\n'
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class LocalNeosServer:
+    def __init__(self, solve=solve_locally, duration=0.0, host='127.0.0.1', port=0):
+        """
+        port 0 picks a free port, see url
+        """
+        self.solve = solve
+        self.duration = duration
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.server = _Server((host, port), allow_none=True, logRequests=False)
+        for method in [self.ping, self.submitJob, self.getJobStatus,
+                       self.getIntermediateResults, self.getFinalResults]:
+            self.server.register_function(method)
+        self.thread = None
+
+    @property
+    def url(self):
+        [host, port] = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def ping(self):
+        return 'NeosServer is alive\n'
+
+    def submitJob(self, xml):
+        with self.lock:
+            job_number = len(self.jobs) + 1
+            password = f'pw{job_number}'
+            self.jobs[job_number] = {'password': password, 'status': 'Running',
+                                     'output': f'Job {job_number} started\n'}
+        threading.Thread(target=self._run, args=(job_number, xml), daemon=True).start()
+        return job_number, password
+
+    def _run(self, job_number, xml):
+        time.sleep(self.duration)
+        job = self.jobs[job_number]
+        try:
+            output = self.solve(xml)
+        except Exception as error:
+            output = f'Error: {error}\n'
+        with self.lock:
+            job['output'] += output
+            job['status'] = 'Done'
+
+    def _job(self, job_number, password):
+        job = self.jobs.get(job_number)
+        if job is None:
+            return None, 'Unknown Job'
+        if job['password'] != password:
+            return None, 'Bad Password'
+        return job, job['status']
+
+    def getJobStatus(self, job_number, password):
+        return self._job(job_number, password)[1]
+
+    def getIntermediateResults(self, job_number, password, offset):
+        job, _ = self._job(job_number, password)
+        output = job['output'] if job is not None else ''
+        return xmlrpc.client.Binary(output[offset:].encode()), len(output)
+
+    def getFinalResults(self, job_number, password):
+        job, status = self._job(job_number, password)
+        output = job['output'] if status == 'Done' else ''
+        return xmlrpc.client.Binary(output.encode())
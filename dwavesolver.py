@@ -1,11 +1,59 @@
 import dimod
+import sys
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from conformation import ConformationBatch
 from dwave_qbsolv import QBSolv
+from instrumentation import NULL_INSTRUMENT
+from itertools import repeat
 from timeit import default_timer as timer
 
 from problem import MolecularConformation
 
 
+def is_tempering(solver):
+    """
+    Whether solver is a ParallelTemperingSampler, which can only be if
+    paralleltempering was imported, so the other solvers do not import it
+    """
+    module = sys.modules.get('paralleltempering')
+    return module is not None and isinstance(solver, module.ParallelTemperingSampler)
+
+
+def sample_repetition(Q, options, seed):
+    """
+    One QBSolv run of the bqm Q, or one run of a ParallelTemperingSampler
+    on all of Q with options['tempering'] as its parameters.
+    Returns (response, seconds spent sampling)
+    """
+    start_time = timer()
+    if is_tempering(options['solver']):
+        response = options['solver'].sample(Q, seed=int(seed), **(options.get('tempering') or {}))
+    else:
+        response = QBSolv().sample(
+            Q,
+            verbosity=options['verbosity'],
+            solver=options['solver'],
+            solver_limit=options.get('solver_limit'),
+            seed=int(seed)
+        )
+    return response, timer() - start_time
+
+
+# the bqm is sent to every worker process once, not with every repetition
+_worker_Q = None
+
+
+def _init_worker(Q):
+    global _worker_Q
+    _worker_Q = Q
+
+
+def _worker_repetition(options, seed):
+    return sample_repetition(_worker_Q, options, seed)
+
+
 class DwaveSolver(MolecularConformation):
     def set_hyper_parameters(self):
         self.A = 1000000                      # scalar for constraint matrix
@@ -61,6 +109,266 @@ class DwaveSolver(MolecularConformation):
         """
         return self.A * self.constraint_Q(scale=True) + self.B * self.objective_Q(scale=True)
 
+    def constraint_coo(self, scale=False, cells=None):
+        """
+        Sparse counterpart of constraint_Q.
+        Returns the nonzero entries of the same upper triangular matrix as
+        (rows, cols, values) coordinate arrays.
+        cells optionally restricts atom i to the spots in cells[i]
+        """
+        cells = self._atom_cells(cells)
+        rows, cols, values = [], [], []
+
+        # every atom is only in 1 spot, pairs within an atom's block
+        for i in range(self.N_ATOMS):
+            [a, b] = np.triu_indices(len(cells[i]))
+            rows.append(self.ij_to_q(i, cells[i][a]))
+            cols.append(self.ij_to_q(i, cells[i][b]))
+            values.append(np.where(a == b, -1.0, 2.0))
+
+        # every spot has at most 1 atom, same spot for different atoms
+        for i in range(self.N_ATOMS):
+            for k in range(i + 1, self.N_ATOMS):
+                j = np.intersect1d(cells[i], cells[k])
+                rows.append(self.ij_to_q(i, j))
+                cols.append(self.ij_to_q(k, j))
+                values.append(np.full(len(j), 2.0))
+
+        return self._finish_coo(rows, cols, values, scale and self.constraint_scale())
+
+    def objective_coo(self, scale=False, cells=None):
+        """
+        Sparse counterpart of objective_Q.
+        Returns the nonzero entries of the same upper triangular matrix as
+        (rows, cols, values) coordinate arrays.
+        The blocks are gathered from the precomputed potential tables,
+        LJ blocks only over the spot pairs in the neighbour lists.
+        cells optionally restricts atom i to the spots in cells[i]
+        """
+        cells = self._atom_cells(cells)
+        rows, cols, values = [], [], []
+        [j_near, l_near] = self.neighbor_pairs()
+        for i in range(self.N_ATOMS):
+            for k in range(i + 1, self.N_ATOMS):
+                if k - i > 1:
+                    allowed = np.zeros([2, self.N_CELLS], dtype=bool)
+                    allowed[0, cells[i]] = True
+                    allowed[1, cells[k]] = True
+                    near = allowed[0, j_near] & allowed[1, l_near]
+                    [j, l] = [j_near[near], l_near[near]]
+                else:
+                    j = np.repeat(cells[i], len(cells[k]))
+                    l = np.tile(cells[k], len(cells[i]))
+                block = 2 * self.pair_table(i, k)[j, l]
+                nonzero = block != 0
+                rows.append(self.ij_to_q(i, j[nonzero]))
+                cols.append(self.ij_to_q(k, l[nonzero]))
+                values.append(block[nonzero])
+
+        return self._finish_coo(rows, cols, values, scale and self.objective_scale())
+
+    def constraint_scale(self):
+        """
+        The max of the full constraint_Q, what scale=True divides by
+        """
+        return 2.0
+
+    def objective_scale(self):
+        """
+        The max of the full objective_Q, what scale=True divides by.
+        Zeros count, like in the dense matrix
+        """
+        lj, bond = self.cell_pair_tables()
+        maxima = [0]
+        if self.N_ATOMS > 1:
+            maxima.append(2 * bond.max())
+        if self.N_ATOMS > 2:
+            maxima.append(2 * lj.max())
+        return max(maxima)
+
+    def U_to_energy(self, U):
+        """
+        Energy of make_bqm of a valid conformation with potential energy U
+        """
+        return -self.A * self.N_ATOMS / 2 + self.B * U / self.objective_scale()
+
+    def _atom_cells(self, cells):
+        if cells is None:
+            return [np.arange(self.N_CELLS)] * self.N_ATOMS
+        return [np.asarray(atom_cells, dtype=int) for atom_cells in cells]
+
+    def _finish_coo(self, rows, cols, values, scale):
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+        values = np.concatenate(values) if values else np.zeros(0)
+        if scale:
+            values = values / scale
+        return rows, cols, values
+
+    def make_coo(self, cells=None):
+        """
+        Returns the complete hamiltonian, the same as make_Q, as
+        (rows, cols, values) coordinate arrays with duplicates summed.
+        cells optionally restricts atom i to the spots in cells[i],
+        the scaling stays that of the full hamiltonian
+        """
+        return self.combine_components(self.make_components(cells), self.A, self.B)
+
+    def make_components(self, cells=None):
+        """
+        The scaled constraint and objective terms of the hamiltonian on
+        one shared set of coordinates, as (rows, cols, constraint values,
+        objective values), so that combine_components can weigh them with
+        any A and B without building them again
+        """
+        c_rows, c_cols, c_values = self.constraint_coo(scale=True, cells=cells)
+        o_rows, o_cols, o_values = self.objective_coo(scale=True, cells=cells)
+
+        rows = np.concatenate([c_rows, o_rows])
+        cols = np.concatenate([c_cols, o_cols])
+
+        # sum entries that appear in both matrices
+        N = self.N_ATOMS * self.N_CELLS
+        keys, inverse = np.unique(rows.astype(np.int64) * N + cols, return_inverse=True)
+        inverse = inverse.ravel()
+        constraint = np.bincount(inverse[:len(c_values)], weights=c_values, minlength=len(keys))
+        objective = np.bincount(inverse[len(c_values):], weights=o_values, minlength=len(keys))
+        return keys // N, keys % N, constraint, objective
+
+    def combine_components(self, components, A, B):
+        """
+        (rows, cols, values) of A * constraint + B * objective
+        for components from make_components
+        """
+        rows, cols, constraint, objective = components
+        return rows, cols, A * constraint + B * objective
+
+    def make_encoding(self, name):
+        """
+        The positionencoding.Encoding called name for this problem size
+        """
+        from positionencoding import ENCODINGS
+        return ENCODINGS[name](self.N_CELLS, self.LATTICE_LENGTH)
+
+    def make_polynomial(self, encoding):
+        """
+        The hamiltonian with the spots of the atoms in encoding, a
+        dimod.BinaryPolynomial over N_ATOMS * encoding.width variables,
+        atom i has variables i * width to (i + 1) * width - 1.
+        Every atom is in exactly one code by construction, codes that are
+        no spot, broken digits and atoms in the same spot cost A each.
+        Energies equal those of make_bqm for the same conformation
+        """
+        terms = defaultdict(float)
+        # the constraints give valid one-hot conformations energy -A * N_ATOMS / 2
+        terms[()] = -self.A * self.N_ATOMS / 2
+
+        for i in range(self.N_ATOMS):
+            base = i * encoding.width
+            for local, bias in encoding.penalty(self.A):
+                terms[tuple(int(base + v) for v in local)] += bias
+
+        scale = self.objective_scale()
+        n_digits = len(encoding.digits)
+        for i in range(self.N_ATOMS):
+            for k in range(i + 1, self.N_ATOMS):
+                table = self.A * np.eye(self.N_CELLS) + self.B * 2 * self.pair_table(i, k) / scale
+                table = encoding.cell_table(table)
+                coefficients = encoding.expand(table)
+                # cancellations leave rounding noise where a term is 0, about an
+                # ulp of the entries summed into it. The objective spans many
+                # orders of magnitude, a bound relative to the largest term
+                # drops real ones
+                noise = np.finfo(float).eps * encoding.expand(np.abs(table), True)
+                coefficients[np.abs(coefficients) <= noise] = 0
+                index = np.array(np.nonzero(coefficients)).T
+                biases = coefficients[tuple(index.T)]
+                local = np.concatenate([
+                    np.where(index[:, :n_digits] > 0, i * encoding.width, 0)
+                    + encoding.variables(index[:, :n_digits]),
+                    np.where(index[:, n_digits:] > 0, k * encoding.width, 0)
+                    + encoding.variables(index[:, n_digits:]),
+                ], axis=1)
+                for row, bias in zip(local.tolist(), biases.tolist()):
+                    terms[tuple(v for v in row if v >= 0)] += bias
+
+        return dimod.BinaryPolynomial(terms, dimod.BINARY)
+
+    def make_encoded_bqm(self, encoding, strength=None):
+        """
+        make_polynomial reduced to a dimod.BinaryQuadraticModel with
+        dimod.make_quadratic. Every product of two variables it introduces
+        costs strength unless it equals their product. The default is the
+        largest sum of |bias| over the terms of one variable, more than any
+        wrong product can gain.
+        The encoded variables keep their labels, the products are labelled
+        from N_ATOMS * encoding.width on
+        """
+        polynomial = self.make_polynomial(encoding)
+        if strength is None:
+            weights = defaultdict(float)
+            for term, bias in polynomial.items():
+                for v in term:
+                    weights[v] += abs(bias)
+            strength = max(weights.values())
+        bqm = dimod.make_quadratic(polynomial, strength, dimod.BINARY)
+        n_encoded = self.N_ATOMS * encoding.width
+        # make_quadratic labels the product of u and v 'u*v'
+        products = [v for v in bqm.variables if isinstance(v, str)]
+        bqm.relabel_variables({v: n_encoded + n for n, v in enumerate(products)})
+        return bqm
+
+    def encoded_to_cells(self, encoding, sampleset):
+        """
+        The (S, N_ATOMS) spots of the samples of a bqm from
+        make_encoded_bqm, -1 for atoms in no spot
+        """
+        n_encoded = self.N_ATOMS * encoding.width
+        values = np.zeros((len(sampleset), n_encoded), dtype=np.int8)
+        labels = np.asarray(sampleset.variables, dtype=int)
+        encoded = labels < n_encoded
+        values[:, labels[encoded]] = sampleset.record.sample[:, encoded]
+        return encoding.decode(values)
+
+    def make_bqm(self, cells=None, cache=None):
+        """
+        Returns the complete hamiltonian as a dimod.BinaryQuadraticModel
+        built from the sparse coordinates, memory scales with the number
+        of nonzero couplings instead of (N_ATOMS * N_CELLS) ** 2.
+        With cells (see candidate_cells) only the surviving variables are
+        in the model, still labelled by their ij_to_q index.
+        With a QuboCache the coordinates are only built if not cached
+        """
+        if cache is not None:
+            coo = cache.coo(self, cells)
+        else:
+            coo = self.make_coo(cells)
+        return self.coo_to_bqm(coo, cells)
+
+    def coo_to_bqm(self, coo, cells=None):
+        """
+        Converts (rows, cols, values) from make_coo, built with the same
+        cells, into a dimod.BinaryQuadraticModel
+        """
+        rows, cols, values = coo
+        variables = np.concatenate([
+            self.ij_to_q(i, atom_cells)
+            for i, atom_cells in enumerate(self._atom_cells(cells))
+        ])
+        variables.sort()
+
+        # ij_to_q index to position in the model
+        rows = np.searchsorted(variables, rows)
+        cols = np.searchsorted(variables, cols)
+        diagonal = rows == cols
+
+        linear = np.zeros(len(variables))
+        np.add.at(linear, rows[diagonal], values[diagonal])
+        quadratic = (rows[~diagonal], cols[~diagonal], values[~diagonal])
+
+        return dimod.BinaryQuadraticModel.from_numpy_vectors(
+            linear, quadratic, 0.0, dimod.BINARY, variable_order=variables.tolist())
+
     # def solve(self, solver='tabu', top_samples=1, visualize=False):
 
     def solve(self, options):
@@ -70,50 +378,185 @@ class DwaveSolver(MolecularConformation):
             'top_samples' - int, how many samples to print
             'visualize' - boolean,
             'verbosity' - int, default 0 (low)
+            'encoding' - 'one_hot' (default) or a name in
+                positionencoding.ENCODINGS, how the spots are encoded
+            'target_U' - float, report the sampling time until a valid
+                conformation with U at most this is found, default none
+            'tempering' - dict of parameters of a ParallelTemperingSampler
+                solver. Its repetitions run one after the other in this
+                process, each going on from the replicas the last one
+                ended with
         """
         DEFAULT_OPTIONS = {
             'solver': 'tabu',
+            'encoding': 'one_hot',
             'top_samples': 1,
             'visualize': False,
             'verbosity': 0,
-            'repititions': 5
+            'repititions': 5,
+            'sparse': True,
+            'prune': False,
+            'cache': False,
+            'workers': 1,
+            'seed': None,
+            'target_U': None,
+            'tempering': {},
+            'no_time': False,
+            'instrument': NULL_INSTRUMENT
         }
         complete_options = DEFAULT_OPTIONS.copy()
         complete_options.update(options)
 
-        # get hamiltonian
-        q = self.make_Q()
+        if self.CUTOFF is not None:
+            error = self.cutoff_error()
+            print(f'LJ cutoff {self.CUTOFF} A drops {100 * error["dropped_pairs"]:.1f}% of spot pairs,',
+                  f'error at most {error["max_pair_error"]} per pair,',
+                  f'{error["max_total_error"]} per conformation')
 
-        # from np matrix to dwave representation
-        Q = dimod.BinaryQuadraticModel.from_numpy_matrix(q)
+        instrument = complete_options['instrument']
 
-        total_time = 0
-        for _ in range(complete_options['repititions']):
-            start_time = timer()
+        # get hamiltonian in dwave representation
+        cache = None
+        if complete_options['cache']:
+            from qubocache import QuboCache
+            cache = QuboCache()
+        cells = self.candidate_cells() if complete_options['prune'] else None
+        encoding = None
+        if complete_options['encoding'] != 'one_hot':
+            # pruning and the cache only apply to one-hot
+            encoding = self.make_encoding(complete_options['encoding'])
+            with instrument.span('build'):
+                Q = self.make_encoded_bqm(encoding)
+            print(f'{encoding.name} encoding: {Q.num_variables} variables,',
+                  f'{Q.num_interactions} couplings')
+        else:
+            with instrument.span('build'):
+                if complete_options['prune'] or complete_options['sparse']:
+                    coo = cache.coo(self, cells) if cache is not None else self.make_coo(cells)
+                else:
+                    q = self.make_Q()
+            with instrument.span('convert'):
+                if complete_options['prune'] or complete_options['sparse']:
+                    Q = self.coo_to_bqm(coo, cells)
+                else:
+                    Q = dimod.BinaryQuadraticModel.from_numpy_matrix(q)
+        if complete_options['prune'] and encoding is None:
+            print(f'pruned to {len(Q.variables)} of {self.N_ATOMS * self.N_CELLS} variables')
+        instrument.count('variables', Q.num_variables)
+        instrument.count('couplings', Q.num_interactions)
+
+        # one distinct seed per repetition, reproducible given 'seed',
+        # kept in the range of a signed 32 bit int for the C solvers
+        repititions = complete_options['repititions']
+        seeds = np.random.SeedSequence(complete_options['seed']).generate_state(repititions) >> 1
+        sample_options = {
+            key: complete_options.get(key)
+            for key in ['verbosity', 'solver', 'solver_limit']
+        }
+
+        solver_name = complete_options['solver']
+        if not isinstance(solver_name, str):
+            solver_name = type(solver_name).__name__
 
-            # solve using QBSolv
-            response = QBSolv().sample(
-                Q,
-                verbosity=complete_options['verbosity'],
-                solver=complete_options['solver']
-            )
+        target_U = complete_options['target_U']
+        tempering = is_tempering(complete_options['solver'])
+        if tempering:
+            sample_options['tempering'] = dict(complete_options['tempering'])
+            if target_U is not None:
+                sample_options['tempering']['target_energy'] = self.U_to_energy(target_U)
 
-            end_time = timer()
+        wall_start = timer()
+        if tempering:
+            runs = []
+            for seed in seeds:
+                runs.append(sample_repetition(Q, sample_options, seed))
+                sample_options['tempering']['initial_states'] = runs[-1][0].info['final_states']
+        elif complete_options['workers'] > 1:
+            with ProcessPoolExecutor(
+                complete_options['workers'], initializer=_init_worker, initargs=(Q,)
+            ) as pool:
+                runs = list(pool.map(_worker_repetition, repeat(sample_options), seeds))
+        else:
+            runs = [sample_repetition(Q, sample_options, seed) for seed in seeds]
+        wall_time = timer() - wall_start
+        instrument.timing('sample_wall', wall_time)
+
+        printed = []
+        total_time = 0
+        for response, solve_time in runs:
+            total_time += solve_time
+            instrument.timing('sample', solve_time)
             if not complete_options['no_time']:
-                print(f'time to solve: {end_time - start_time} s')
-                total_time += end_time - start_time
+                print(f'time to solve: {solve_time} s')
 
+            # score the printed samples in one pass, lowest energy first
+            top = response.truncate(complete_options['top_samples'])
+            best = self.sampleset_to_batch(top, encoding, solver_name, instrument=instrument)
+            printed.append(best)
 
-            for sample_i, sample in enumerate(response.samples()[0:complete_options['top_samples']]):
-                X = self.sample_to_x_ij_matrix(sample)
+            for sample_i, conformation in enumerate(best):
                 print(f'------- sample {sample_i} -------')
-                print('solution is valid:', self.is_solution_valid(X))
-                print('energy:', response.record.energy[sample_i])
-                print('total U:', self.objective_value(X.flat))
+                print('solution is valid:', conformation.valid)
+                print('energy:', conformation.energy)
+                print('total U:', conformation.U)
 
                 if complete_options['visualize']:
-                    positions = self.sample_to_positions(sample)
-                    self.plot_3d(positions)
+                    self.plot_3d(self.cells_to_positions(conformation.cells))
+
+        if not complete_options['no_time']:
+            avg_time = total_time / complete_options['repititions']
+            print(f'average time: {avg_time} s')
+            workers = 1 if tempering else complete_options['workers']
+            print(f'wall time: {wall_time} s ({workers} workers)')
+
+        printed = ConformationBatch.concatenate(printed)
+        distinct, counts = printed[printed.valid].distinct(self)
+        print(f'distinct conformations: {len(distinct)} of {int(printed.valid.sum())} valid samples')
+        for conformation, count in zip(distinct, counts):
+            print(f'  U {conformation.U}: {count} times')
+
+        if target_U is not None:
+            time_to_target = self.time_to_target(runs, target_U, encoding)
+            if time_to_target is None:
+                print(f'U {target_U} not reached in {total_time} s')
+            else:
+                instrument.timing('time_to_target', time_to_target)
+                print(f'time to U {target_U}: {time_to_target} s')
+
+        response = dimod.concatenate([response for response, _ in runs])
+        if instrument.enabled:
+            # scoring every sample is only worth it when someone looks
+            scored = self.sampleset_to_batch(response, encoding)
+            instrument.count('samples', len(scored))
+            instrument.count('valid_rate', float(np.mean(scored.valid)))
+            instrument.count('distinct_valid', len(scored[scored.valid].distinct(self)[0]))
+        return response
 
-        avg_time = total_time / complete_options['repititions']
-        print(f'average time: {avg_time} s')
+    def time_to_target(self, runs, target_U, encoding=None):
+        """
+        Sampling time of the (response, seconds) runs of solve until the
+        first valid conformation with U at most target_U, the time
+        within a run from its info if the sampler reports it.
+        None if no run reached it
+        """
+        elapsed = 0
+        for response, solve_time in runs:
+            batch = self.sampleset_to_batch(response, encoding)
+            if (batch.valid & (batch.U <= target_U)).any():
+                reported = response.info.get('time_to_target')
+                return elapsed + (solve_time if reported is None else reported)
+            elapsed += solve_time
+        return None
+
+    def sampleset_to_batch(self, sampleset, encoding=None, solver=None, instrument=NULL_INSTRUMENT):
+        """
+        Decodes and scores a SampleSet of make_bqm, or of make_encoded_bqm
+        with encoding, into a ConformationBatch. Decoding and scoring are
+        the decode and score spans of instrument
+        """
+        if encoding is None:
+            return ConformationBatch.from_samples(self, sampleset, solver=solver, instrument=instrument)
+        with instrument.span('decode'):
+            cells = self.encoded_to_cells(encoding, sampleset)
+        with instrument.span('score'):
+            return ConformationBatch.from_cells(self, cells, sampleset.record.energy, solver)
@@ -0,0 +1,245 @@
+'''
+Exact solver for small instances. Depth-first branch and bound over the
+placements of the atoms along the chain, atom t is placed after atoms
+0 .. t - 1. A branch is cut once its energy plus a lower bound on the
+energy still to come can not beat the best conformation found so far,
+which keeps atom t + 1 within the bond shell of atom t that the remaining
+energy budget allows. Conformations that are a lattice symmetry of each
+other are only searched once, atom 0 is in one spot of every orbit of the
+48 symmetries and atom 1 in one spot of every orbit of the symmetries that
+keep atom 0 in place. The subtrees of the first bond are searched in a
+process pool that shares the best energy found.
+'''
+
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+
+from conformation import ConformationBatch
+from instrumentation import NULL_INSTRUMENT
+from localsearch import LocalSearchSolver
+from problem import MolecularConformation
+
+
+# shared by the worker processes of one search
+_worker_solver = None
+_worker_best = None
+
+
+def _init_worker(solver, best):
+    global _worker_solver, _worker_best
+    _worker_solver = solver
+    _worker_best = best
+
+
+def _worker_subtree(cells):
+    return _worker_solver.search_subtree(cells, _worker_best)
+
+
+class _LocalBest:
+    """
+    Stands in for the shared multiprocessing.Value without a pool
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def get_lock(self):
+        return _NO_LOCK
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_LOCK = _NoLock()
+
+
+class ExactSolver(MolecularConformation):
+    def set_hyper_parameters(self):
+        self.INCUMBENT_RUNS = 3         # local search runs for the first upper bound
+        self.INCUMBENT_SWEEPS = 500
+
+    def first_bonds(self):
+        """
+        (atom 0 spot, atom 1 spot) of every subtree left after symmetry
+        breaking, as an array of shape (n, 2)
+        """
+        symmetries = self.symmetries()
+        # the smallest spot of every orbit
+        first = np.flatnonzero(symmetries.min(axis=0) == np.arange(self.N_CELLS))
+        if self.N_ATOMS == 1:
+            return first[:, None]
+
+        bonds = []
+        for c0 in first:
+            stabilizer = symmetries[symmetries[:, c0] == c0]
+            second = np.flatnonzero(stabilizer.min(axis=0) == np.arange(self.N_CELLS))
+            bonds += [(c0, c1) for c1 in second if c1 != c0]
+        return np.array(bonds)
+
+    def _prepare(self):
+        lj, bond = self.cell_pair_tables()
+        self._lj = lj
+        self._bond = bond
+        off_diagonal = ~np.eye(self.N_CELLS, dtype=bool)
+        self._lj_min = min(lj[off_diagonal].min(), 0)
+        self._bond_min = bond[off_diagonal].min()
+
+    def remaining_bound(self, t, lj_sum):
+        """
+        Lower bound on the energy between atoms t + 1 .. B - 1 and all
+        atoms before them, with atoms 0 .. t placed. lj_sum is the LJ of
+        atoms 0 .. t - 1 with every spot.
+        Every pair is counted twice like in U
+        """
+        bound = 0
+        placed_min = min(lj_sum.min(), 0)
+        for s in range(t + 1, self.N_ATOMS):
+            # bond to s - 1, LJ to the placed atoms and to the unplaced ones before s - 1
+            bound += self._bond_min + placed_min
+            if s > t + 1:
+                bound += (s - t - 1) * self._lj_min
+        return 2 * bound
+
+    def search_subtree(self, cells, best):
+        """
+        Searches every conformation that starts with the spots cells.
+        best is the shared best energy, read to prune and lowered when a
+        better conformation is found.
+        Returns (energy, cells) of the best conformation of the subtree that
+        beat best, (inf, None) if none did, and the number of nodes visited
+        """
+        self._prepare()
+        cells = np.asarray(cells)
+        t = len(cells)
+        energy = 2 * sum(
+            self.pair_table(i, k)[cells[i], cells[k]]
+            for i in range(t) for k in range(i + 1, t)
+        )
+        occupied = np.zeros(self.N_CELLS, dtype=bool)
+        occupied[cells] = True
+        lj_sum = self._lj[cells[:-1]].sum(axis=0)
+
+        placement = np.full(self.N_ATOMS, -1)
+        placement[:t] = cells
+        found = [np.inf, None]
+        nodes = self._search(t, placement, energy, lj_sum, occupied, best, found)
+        return found[0], found[1], nodes
+
+    def _search(self, t, placement, energy, lj_sum, occupied, best, found):
+        """
+        Places atom t, lj_sum is the LJ of atoms 0 .. t - 2 with every spot
+        """
+        if t == self.N_ATOMS:
+            with best.get_lock():
+                if energy < best.value:
+                    best.value = energy
+                    found[0], found[1] = energy, placement.copy()
+            return 1
+
+        # energy of atom t with the atoms before it, for every spot
+        increments = 2 * (self._bond[placement[t - 1]] + lj_sum)
+        increments[occupied] = np.inf
+        next_lj_sum = lj_sum + self._lj[placement[t - 1]]
+        bound = energy + increments + self.remaining_bound(t, next_lj_sum)
+
+        nodes = 1
+        candidates = np.flatnonzero(bound < best.value)
+        for c in candidates[np.argsort(increments[candidates], kind='stable')]:
+            # best may have dropped in the meantime, also in other processes
+            if bound[c] >= best.value:
+                continue
+            placement[t] = c
+            occupied[c] = True
+            nodes += self._search(t + 1, placement, energy + increments[c],
+                                  next_lj_sum, occupied, best, found)
+            occupied[c] = False
+        placement[t] = -1
+        return nodes
+
+    def incumbent(self, seed=None):
+        """
+        A first upper bound from a few short local search runs,
+        returns (U, cells)
+        """
+        local = LocalSearchSolver(self.N_ATOMS, self.LATTICE_LENGTH)
+        for name in ['CELL_LENGTH', 'SIGMA', 'e', 'bond_length', 'BETA', 'CUTOFF', 'CUTOFF_SHIFT']:
+            setattr(local, name, getattr(self, name))
+        rng = np.random.default_rng(seed)
+        runs = [local.anneal(rng, self.INCUMBENT_SWEEPS) for _ in range(self.INCUMBENT_RUNS)]
+        cells, U, _ = min(runs, key=lambda run: run[1])
+        return U, cells
+
+    def search(self, workers=1, seed=None):
+        """
+        Proves the optimum. Returns (cells, U, number of nodes visited)
+        """
+        if self.N_ATOMS > self.N_CELLS:
+            raise ValueError('more atoms than spots', self.N_ATOMS, self.N_CELLS)
+        best_U, best_cells = self.incumbent(seed)
+        # the optimum may equal the incumbent, a hair above lets the search find it
+        start = best_U + 1e-9 * max(abs(best_U), 1)
+
+        subtrees = self.first_bonds()
+        if workers > 1:
+            shared = multiprocessing.Value('d', start)
+            with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(self, shared)) as pool:
+                results = list(pool.map(_worker_subtree, subtrees))
+        else:
+            local_best = _LocalBest(start)
+            results = [self.search_subtree(cells, local_best) for cells in subtrees]
+
+        nodes = sum(result[2] for result in results)
+        for U, cells, _ in results:
+            if cells is not None and U <= best_U:
+                best_U, best_cells = U, cells
+        # recompute from scratch, the search sums increments
+        U = self.objective_values(np.asarray(best_cells)[None, :])[0][0]
+        return np.asarray(best_cells), U, nodes
+
+    def solve(self, options):
+        """
+        Options:
+            'workers' - int, processes to search the subtrees in, default 1
+            'seed' - int, seed of the local search for the first bound
+            'visualize' - boolean,
+            'instrument' - Instrument that records stage timings and
+                counters, default records nothing
+        Returns a ConformationBatch with the optimum
+        """
+        DEFAULT_OPTIONS = {
+            'workers': 1,
+            'seed': None,
+            'visualize': False,
+            'no_time': False,
+            'instrument': NULL_INSTRUMENT
+        }
+        complete_options = DEFAULT_OPTIONS.copy()
+        complete_options.update(options)
+        instrument = complete_options['instrument']
+
+        start_time = timer()
+        with instrument.span('search'):
+            cells, U, nodes = self.search(complete_options['workers'], complete_options['seed'])
+        solve_time = timer() - start_time
+        instrument.count('nodes', nodes)
+
+        result = ConformationBatch(cells[None, :], self.LATTICE_LENGTH, U=[U], solver='exact')
+        print('------- optimum -------')
+        print('solution is valid:', result.valid[0])
+        print('total U:', U)
+        print('cells:', cells.tolist())
+        print(f'nodes searched: {nodes}')
+        if not complete_options['no_time']:
+            print(f'time to solve: {solve_time} s ({complete_options["workers"]} workers)')
+
+        if complete_options['visualize']:
+            self.plot_3d(self.cells_to_positions(cells))
+        return result
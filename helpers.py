@@ -1,6 +1,4 @@
-import math
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+import itertools
 import numpy as np
 
 
@@ -32,34 +30,186 @@ class EquationsMixin:
         bond = self.bond_stretching_potential(distance, is_next)
         return np.nan_to_num(bond, 0)
 
-    def potential_from_indices(self, i, j, k, l):
-        # j and l are the spot index, change to coordinates
-        j_loc = self.index_to_location(j)
-        l_loc = self.index_to_location(l)
+    def potential_tables(self):
+        """
+        U only depends on the displacement between two cells, so the LJ and
+        bond stretching potentials are computed once per lattice for every
+        displacement (dx, dy, dz), each in [-(L - 1), L - 1].
+        Returns (lj, bond) arrays of shape (2L - 1, 2L - 1, 2L - 1),
+        a displacement d is looked up at d + L - 1
+        """
+        key = (self.LATTICE_LENGTH, self.CELL_LENGTH, self.SIGMA, self.e,
+               self.bond_length, self.BETA, self.CUTOFF, self.CUTOFF_SHIFT)
+        if getattr(self, '_potential_tables_key', None) != key:
+            size = 2 * self.LATTICE_LENGTH - 1
+            displacement = np.indices((size, size, size)) - (self.LATTICE_LENGTH - 1)
+            distance = self.distance(displacement, 0)
+
+            self._potential_tables = (
+                self.cutoff_potential(distance),
+                self.bond_stretching_potential(distance)
+            )
+            self._potential_tables_key = key
+        return self._potential_tables
+
+    def cutoff_potential(self, distance):
+        """
+        LJ with every pair further apart than CUTOFF dropped, optionally
+        shifted so it goes to 0 at the cutoff. The plain LJ with no CUTOFF
+        """
+        lj = self.leonard_jones_potential(distance)
+        if self.CUTOFF is None:
+            return lj
+        if self.CUTOFF_SHIFT:
+            lj = lj - self.leonard_jones_potential(np.array([self.CUTOFF]))[0]
+        # distance 0 is the same spot, which no pair of atoms can share
+        return np.where((distance > 0) & (distance <= self.CUTOFF), lj, 0)
+
+    def cutoff_error(self):
+        """
+        How far the cut off LJ is from the full LJ on this lattice.
+        Returns a dict with the largest error of one pair, a bound on the
+        error of a whole conformation and the share of spot pairs dropped
+        """
+        size = 2 * self.LATTICE_LENGTH - 1
+        displacement = np.indices((size, size, size)) - (self.LATTICE_LENGTH - 1)
+        distance = self.distance(displacement, 0)
+        error = np.abs(self.cutoff_potential(distance) - self.leonard_jones_potential(distance))
+
+        # ordered pairs of atoms that interact through LJ
+        lj_pairs = max(self.N_ATOMS - 2, 0) * max(self.N_ATOMS - 1, 0)
+        [j, l] = self.neighbor_pairs()
+        return {
+            'max_pair_error': error.max(),
+            'max_total_error': lj_pairs * error.max(),
+            'dropped_pairs': 1 - len(j) / self.N_CELLS ** 2
+        }
 
-        # distance between j and l
-        distance = self.distance(j_loc, l_loc)
+    def neighbor_pairs(self):
+        """
+        (j, l) for every pair of spots within CUTOFF of each other, every
+        pair when there is no cutoff. Sorted by j, so the neighbours of a spot
+        are one contiguous run, i.e. the flattened per-spot neighbour lists
+        """
+        key = (self.LATTICE_LENGTH, self.CELL_LENGTH, self.CUTOFF)
+        if getattr(self, '_neighbor_pairs_key', None) != key:
+            coordinates = self.cell_coordinates()
+            if self.CUTOFF is None:
+                within = np.ones([self.N_CELLS, self.N_CELLS], dtype=bool)
+            else:
+                distance = self.distance(coordinates.T[:, :, None], coordinates.T[:, None, :])
+                within = distance <= self.CUTOFF
+            self._neighbor_pairs = np.nonzero(within)
+            self._neighbor_pairs_key = key
+        return self._neighbor_pairs
+
+    def cell_pair_tables(self):
+        """
+        The potential tables gathered for every pair of cells (j, l).
+        Returns (lj, bond) arrays of shape N_CELLS x N_CELLS
+        """
+        lj, bond = self.potential_tables()
+        if getattr(self, '_cell_pair_tables_key', None) != self._potential_tables_key:
+            coordinates = self.cell_coordinates()
+            displacement = coordinates[:, None, :] - coordinates[None, :, :]
+            index = tuple(np.moveaxis(displacement + self.LATTICE_LENGTH - 1, -1, 0))
+            self._cell_pair_tables = (lj[index], bond[index])
+            self._cell_pair_tables_key = self._potential_tables_key
+        return self._cell_pair_tables
+
+    def pair_table(self, i, k):
+        """
+        Returns the N_CELLS x N_CELLS table of U_ijkl over (j, l)
+        for atoms i and k
+        """
+        lj, bond = self.cell_pair_tables()
+        if abs(k - i) == 1:
+            return bond
+        if i == k:
+            return np.zeros_like(lj)
+        return lj
+
+    def potential_from_indices(self, i, j, k, l):
+        # j and l are the spot index, look up their displacement
+        coordinates = self.cell_coordinates()
+        j_loc = coordinates[np.asarray(j, dtype=int)]
+        l_loc = coordinates[np.asarray(l, dtype=int)]
+        index = tuple(np.moveaxis(j_loc - l_loc + self.LATTICE_LENGTH - 1, -1, 0))
 
         # boolean matrices or different properties
         is_adjacent_atom = (np.abs(k - i) == 1)
         is_the_same_atom = i == k
 
-        full_lj = self.leonard_jones_potential(distance)
-        full_bond = self.bond_stretching_potential(distance)
+        table_lj, table_bond = self.potential_tables()
+        full_lj = table_lj[index]
+        full_bond = table_bond[index]
 
         bond = (1 * is_adjacent_atom) * full_bond
         lj = 1 * np.logical_not(is_adjacent_atom | is_the_same_atom) * full_lj
         return lj + bond
 
     def objective_value(self, solution):
-        total = 0
-        ones = filter(lambda t: t[1] == 1, enumerate(solution))
-        for (ij, one) in ones:
-            [i, j] = self.q_to_ij(ij)
-            for (kl, one) in ones:
-                [k, l] = self.q_to_ij(kl)
-                total += self.potential_from_indices(i, j, k, l)
-        return total
+        """
+        Total U of a 0-1 solution vector, summed over every pair
+        of occupied (ij, kl)
+        """
+        energies, _ = self.objective_values(np.asarray(solution)[None, :])
+        return energies[0]
+
+    def objective_values(self, samples):
+        """
+        Scores many samples in one vectorized pass.
+        Input: either an (S, N_ATOMS * N_CELLS) 0-1 array in ij_to_q order,
+        e.g. SampleSet.record.sample, or an (S, N_ATOMS) array of occupied cells
+        Returns (U, violations), two length S arrays.
+        U is the first term in the hamiltonian (eq 8), violations is the value
+        of the two constraint terms without A, 0 for valid solutions.
+        The unscaled constraint_Q energy of a sample is violations - N_ATOMS
+        """
+        samples = np.asarray(samples)
+        if samples.shape[1] == self.N_ATOMS:
+            return self._cell_objective_values(samples.astype(int))
+
+        X = samples.reshape(-1, self.N_ATOMS, self.N_CELLS)
+        atom_counts = X.sum(axis=2)
+        one_hot = (atom_counts == 1).all(axis=1)
+
+        energies = np.zeros(len(X))
+        violations = np.zeros(len(X))
+        if one_hot.any():
+            cells = X[one_hot].argmax(axis=2)
+            energies[one_hot], violations[one_hot] = self._cell_objective_values(cells)
+
+        rest = ~one_hot
+        if rest.any():
+            X = X[rest].astype(float)
+            lj, bond = self.cell_pair_tables()
+            atoms = np.arange(self.N_ATOMS)
+            separation = np.abs(atoms[:, None] - atoms[None, :])
+            for table, mask in [(lj, separation > 1), (bond, separation == 1)]:
+                # x_i^T U x_k for every pair of atoms in every sample
+                pair_energies = np.einsum('sin,skn->sik', X @ table, X)
+                energies[rest] += np.sum(pair_energies * mask, axis=(1, 2))
+
+            cell_counts = X.sum(axis=1)
+            violations[rest] = (
+                np.sum((atom_counts[rest] - 1) ** 2, axis=1)
+                + np.sum(cell_counts * (cell_counts - 1), axis=1)
+            )
+        return energies, violations
+
+    def _cell_objective_values(self, cells):
+        lj, bond = self.cell_pair_tables()
+        tables = np.stack([np.zeros_like(lj), bond, lj])
+        atoms = np.arange(self.N_ATOMS)
+        kinds = np.minimum(np.abs(atoms[:, None] - atoms[None, :]), 2)
+
+        pair_energies = tables[kinds[None, :, :], cells[:, :, None], cells[:, None, :]]
+        energies = np.sum(pair_energies, axis=(1, 2))
+
+        # ordered pairs of different atoms in the same cell
+        shared = np.sum(cells[:, :, None] == cells[:, None, :], axis=(1, 2)) - self.N_ATOMS
+        return energies, shared.astype(float)
 
 
 class UtilsMixin:
@@ -81,7 +231,97 @@ class UtilsMixin:
         """
         Given a binary variable index returns i, j corresponding to atom i being in spot j
         """
-        return (np.floor(q_index / self.N_CELLS), q_index % self.N_CELLS)
+        return np.divmod(q_index, self.N_CELLS)
+
+    def cell_coordinates(self):
+        """
+        Returns the integer lattice coordinates of every spot,
+        an N_CELLS x 3 array with the same layout as index_to_location
+        """
+        if getattr(self, '_cell_coordinates_key', None) != self.LATTICE_LENGTH:
+            j = np.arange(self.LATTICE_LENGTH ** 3)
+            self._cell_coordinates = np.stack(
+                [j // self.LATTICE_LENGTH ** d % self.LATTICE_LENGTH for d in range(3)],
+                axis=1
+            )
+            self._cell_coordinates_key = self.LATTICE_LENGTH
+        return self._cell_coordinates
+
+    def canonical_cells(self):
+        """
+        The spots every spot can be mapped onto by one of the 48 symmetries
+        of the cubic lattice (reflecting and permuting the axes),
+        those in the lower half of every axis with x <= y <= z
+        """
+        coordinates = self.cell_coordinates()
+        lower_half = (2 * coordinates <= self.LATTICE_LENGTH - 1).all(axis=1)
+        ordered = (coordinates[:, 0] <= coordinates[:, 1]) & (coordinates[:, 1] <= coordinates[:, 2])
+        return np.flatnonzero(lower_half & ordered)
+
+    def symmetries(self):
+        """
+        The 48 symmetries of the cubic lattice as a 48 x N_CELLS array,
+        row g holds the spot every spot is mapped to. Row 0 is the identity
+        """
+        if getattr(self, '_symmetries_key', None) != self.LATTICE_LENGTH:
+            coordinates = self.cell_coordinates()
+            strides = self.LATTICE_LENGTH ** np.arange(3)
+            rows = []
+            for axes in itertools.permutations(range(3)):
+                for flips in itertools.product([False, True], repeat=3):
+                    mapped = coordinates[:, list(axes)]
+                    mapped = np.where(flips, self.LATTICE_LENGTH - 1 - mapped, mapped)
+                    rows.append(mapped @ strides)
+            self._symmetries = np.array(rows)
+            self._symmetries_key = self.LATTICE_LENGTH
+        return self._symmetries
+
+    def canonical_form(self, cells):
+        """
+        The canonical form of an (S, N_ATOMS) array of spots under every
+        symmetry U does not see: the 48 of the cubic lattice, translations
+        and reversing the chain. Of the 96 images of a conformation, each
+        shifted against the lower faces of the lattice, it is the one with
+        the lexicographically smallest spots. Conformations that are a
+        symmetry of each other have the same canonical form.
+        Rows with an atom in no spot (-1) are returned as they are
+        """
+        cells = np.atleast_2d(cells)
+        canonical = cells.copy()
+        placed = (cells >= 0).all(axis=1)
+        if not placed.any():
+            return canonical
+
+        images = self.symmetries()[:, cells[placed]]
+        images = np.concatenate([images, images[:, :, ::-1]])
+        coordinates = self.cell_coordinates()[images]
+        coordinates -= coordinates.min(axis=2, keepdims=True)
+        images = coordinates @ self.LATTICE_LENGTH ** np.arange(3)
+
+        # narrow the images down to the smallest one atom at a time
+        smallest = np.ones(images.shape[:2], dtype=bool)
+        for atom in range(self.N_ATOMS):
+            spots = np.where(smallest, images[:, :, atom], self.N_CELLS)
+            smallest &= spots == spots.min(axis=0)
+        canonical[placed] = images[smallest.argmax(axis=0), np.arange(images.shape[1])]
+        return canonical
+
+    def candidate_cells(self):
+        """
+        The spots left for every atom after symmetry breaking and bond
+        shell pruning. Any conformation can be rotated or reflected so atom 0
+        is in a canonical spot, and atom i + 1 has to be within BOND_RADIUS
+        of a spot atom i can be in, further apart the bond penalty is too large.
+        Returns a list with an array of spots for every atom
+        """
+        coordinates = self.cell_coordinates().T
+        distance = self.distance(coordinates[:, :, None], coordinates[:, None, :])
+        within_bond = distance <= self.BOND_RADIUS
+
+        cells = [self.canonical_cells()]
+        for _ in range(1, self.N_ATOMS):
+            cells.append(np.flatnonzero(within_bond[cells[-1]].any(axis=0)))
+        return cells
 
     def index_to_location(self, i):
         """
@@ -102,31 +342,75 @@ class UtilsMixin:
         correct_number_of_atoms = np.sum(X) == self.N_ATOMS
         return every_atom_in_one_spot and spot_has_zero_or_one_atoms and correct_number_of_atoms
 
+    def sampleset_to_array(self, sampleset):
+        """
+        Returns the samples of a dimod SampleSet as an
+        (S, N_ATOMS * N_CELLS) 0-1 array with columns in ij_to_q order
+        """
+        samples = np.zeros([len(sampleset), self.N_ATOMS * self.N_CELLS], dtype=np.int8)
+        samples[:, np.asarray(sampleset.variables, dtype=int)] = sampleset.record.sample
+        return samples
+
+    def samples_to_cells(self, samples):
+        """
+        Decodes many samples at once. Takes a SampleSet or an
+        (S, N_ATOMS * N_CELLS) 0-1 array in ij_to_q order, like
+        SampleSet.record.sample, and returns an (S, N_ATOMS) integer array
+        of the spot of every atom, -1 if the atom is in no spot and the
+        first of its spots if it is in several
+        """
+        if hasattr(samples, 'record'):
+            samples = self.sampleset_to_array(samples)
+        X = np.asarray(samples).reshape(-1, self.N_ATOMS, self.N_CELLS)
+        cells = X.argmax(axis=2)
+        cells[~X.any(axis=2)] = -1
+        return cells
+
+    def samples_to_positions(self, samples):
+        """
+        Like samples_to_cells but returns the (S, N_ATOMS, 3) grid
+        positions, atoms in no spot are at the origin
+        """
+        return self.cells_to_positions(self.samples_to_cells(samples))
+
+    def cells_to_positions(self, cells):
+        """
+        The grid positions of an array of spots, -1 (no spot) is at the origin
+        """
+        cells = np.asarray(cells)
+        positions = self.cell_coordinates()[cells].astype(float)
+        positions[cells == -1] = 0
+        return positions
+
+    def sample_to_array(self, sample):
+        """
+        Turns a sample in the form of a dict {q: 0|1, ...} into a
+        0-1 array of length N_ATOMS * N_CELLS in ij_to_q order
+        """
+        sample = dict(sample)
+        x = np.zeros(self.N_ATOMS * self.N_CELLS)
+        x[np.fromiter(sample.keys(), dtype=int, count=len(sample))] = list(sample.values())
+        return x
+
     def sample_to_x_ij_matrix(self, sample):
         """
         Turns a sample from the form of a dict {(i,j): 0|1, ...} into a np
-        0-1 matrix of size N_ATOMS x N_CELLS  
+        0-1 matrix of size N_ATOMS x N_CELLS
         """
-        X = np.zeros([self.N_ATOMS, self.N_CELLS])
-        ones = filter(lambda i: i[1] == 1, dict(sample).items())
-        for qi, _ in ones:
-            (i, j) = self.q_to_ij(qi)
-            X[math.floor(i), j] = 1
-        return X
+        return (self.sample_to_array(sample) == 1).reshape(self.N_ATOMS, self.N_CELLS) * 1.0
 
     def sample_to_positions(self, sample):
         """
         Turns a sample from the form of a dict {(i,j): 0|1, ...} into a np
         matrix of size N_ATOMS x 3 which is a list of the grid positions in R^3
         """
-        positions = np.zeros([self.N_ATOMS, 3])
-        ones = filter(lambda i: i[1] == 1, dict(sample).items())
-        for qi, _ in ones:
-            (i, j) = self.q_to_ij(qi)
-            positions[math.floor(i), :] = self.index_to_location(j)
-        return positions
+        return self.samples_to_positions(self.sample_to_array(sample) == 1)[0]
 
     def plot_3d(self, positions):
+        # matplotlib is slow to import and only needed here
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d import Axes3D
+
         fig = plt.figure()
         ax = fig.add_subplot(111, projection='3d')
 
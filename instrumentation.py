@@ -0,0 +1,115 @@
+'''
+Stage timings, counters and peak memory of a solver run.
+Solvers take an Instrument and wrap their stages in instrument.span(name).
+Without a sink nothing is measured or recorded and span returns one shared
+do-nothing context manager, so a disabled Instrument costs next to nothing.
+'''
+
+import json
+import sys
+import time
+from timeit import default_timer as timer
+
+try:
+    import resource
+except ImportError:     # not on Windows
+    resource = None
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class JsonLinesSink:
+    """
+    Writes every record as one line of JSON to a path or a text stream
+    """
+
+    def __init__(self, target):
+        if hasattr(target, 'write'):
+            self.stream, self.owned = target, False
+        else:
+            self.stream, self.owned = open(target, 'a'), True
+
+    def __call__(self, record):
+        self.stream.write(json.dumps(record, default=float) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = timer()
+        return self
+
+    def __exit__(self, *args):
+        self.instrument.timing(self.name, timer() - self.start_time)
+        return False
+
+
+class Instrument:
+    """
+    sink is any callable taking a dict, e.g. a JsonLinesSink.
+    context is added to every record, e.g. the solver and problem size
+    """
+
+    def __init__(self, sink=None, **context):
+        self.sink = sink
+        self.enabled = sink is not None
+        self.context = context
+
+    def span(self, name):
+        """
+        Context manager recording how long the block took
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def timing(self, name, seconds):
+        """
+        Records a span that was timed elsewhere, e.g. in a worker process
+        """
+        if self.enabled:
+            self.emit({'type': 'span', 'name': name, 'seconds': seconds, 'peak_rss': peak_rss()})
+
+    def count(self, name, value):
+        if self.enabled:
+            self.emit({'type': 'count', 'name': name, 'value': value})
+
+    def emit(self, record):
+        record.update(self.context)
+        record['time'] = time.time()
+        self.sink(record)
+
+    def close(self):
+        if self.enabled and hasattr(self.sink, 'close'):
+            self.sink.close()
+
+
+NULL_INSTRUMENT = Instrument()
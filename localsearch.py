@@ -0,0 +1,212 @@
+import numpy as np
+from timeit import default_timer as timer
+
+from conformation import ConformationBatch, cells_to_samples
+from instrumentation import NULL_INSTRUMENT
+from problem import MolecularConformation
+
+
+# quarter turn rotations about the x, y and z axes
+QUARTER_TURNS = [
+    np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]]),
+    np.array([[0, 0, 1], [0, 1, 0], [-1, 0, 0]]),
+    np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]]),
+]
+ROTATIONS = [
+    np.linalg.matrix_power(turn, times)
+    for turn in QUARTER_TURNS for times in range(1, 4)
+]
+
+
+class LocalSearchSolver(MolecularConformation):
+    """
+    Simulated annealing directly on the placement of the B atoms.
+    Every state has each atom in exactly one spot and every spot
+    holds at most one atom, so the constraint terms of the hamiltonian
+    are never needed and every returned conformation is valid.
+    """
+
+    def set_hyper_parameters(self):
+        self.SWEEPS = 2000              # moves per atom in one anneal
+        self.T_FINAL = 1e-3             # final temperature, kcal
+
+    def energy_tables(self):
+        """
+        Returns (tables, kinds) where tables[kinds[i, k]][j, l] is U_ijkl
+        """
+        lj, bond = self.cell_pair_tables()
+        tables = np.stack([np.zeros_like(lj), bond, lj])
+        atoms = np.arange(self.N_ATOMS)
+        kinds = np.minimum(np.abs(atoms[:, None] - atoms[None, :]), 2)
+        return tables, kinds
+
+    def delta_energy(self, cells, moved, targets):
+        """
+        Change of total U when the atoms in `moved` go to `targets`.
+        Only the rows of the moved atoms are looked up, O(B) per moved atom
+        """
+        tables, kinds = self._tables, self._kinds
+        new_cells = cells.copy()
+        new_cells[moved] = targets
+
+        new_rows = tables[kinds[moved], targets[:, None], new_cells[None, :]]
+        old_rows = tables[kinds[moved], cells[moved][:, None], cells[None, :]]
+
+        # pairs between two moved atoms are in both rows
+        delta = 2 * (new_rows.sum() - old_rows.sum())
+        delta -= new_rows[:, moved].sum() - old_rows[:, moved].sum()
+        return delta
+
+    def propose(self, cells, occupied, rng):
+        """
+        Returns (moved atoms, target spots) for a random feasible move,
+        or None if the drawn move leaves the lattice or hits an atom
+        """
+        move = rng.integers(3)
+
+        if move == 0 or self.N_ATOMS < 2:
+            # relocate one atom to an empty spot
+            i = rng.integers(self.N_ATOMS)
+            target = rng.integers(self.N_CELLS)
+            if occupied[target]:
+                return None
+            return np.array([i]), np.array([target])
+
+        if move == 1:
+            # swap the spots of two atoms
+            [i, k] = rng.choice(self.N_ATOMS, 2, replace=False)
+            return np.array([i, k]), np.array([cells[k], cells[i]])
+
+        # crankshaft, rotate a segment about its neighbours along the chain.
+        # End atoms pivot about their neighbour, interior pairs (i, i + 1)
+        # about the axis through i - 1, which keeps both bonds when
+        # i - 1 and i + 2 lie on a line parallel to a lattice axis
+        coordinates = self.cell_coordinates()
+        i = rng.integers(self.N_ATOMS - 2) if self.N_ATOMS > 2 else 0
+        if i == 0:
+            end = rng.integers(2)
+            moved = np.array([0]) if end == 0 else np.array([self.N_ATOMS - 1])
+            pivot = coordinates[cells[1 if end == 0 else self.N_ATOMS - 2]]
+            rotation = ROTATIONS[rng.integers(len(ROTATIONS))]
+        else:
+            moved = np.array([i, i + 1])
+            pivot = coordinates[cells[i - 1]]
+            axis = coordinates[cells[i + 2]] - pivot
+            if np.count_nonzero(axis) == 1:
+                turns = ROTATIONS[3 * np.flatnonzero(axis)[0]:][:3]
+                rotation = turns[rng.integers(3)]
+            else:
+                rotation = ROTATIONS[rng.integers(len(ROTATIONS))]
+
+        locations = pivot + (coordinates[cells[moved]] - pivot) @ rotation.T
+        if ((locations < 0) | (locations >= self.LATTICE_LENGTH)).any():
+            return None
+        targets = locations @ (self.LATTICE_LENGTH ** np.arange(3))
+        occupied_by_others = occupied[targets] & ~np.isin(targets, cells[moved])
+        if occupied_by_others.any():
+            return None
+        return moved, targets
+
+    def anneal(self, rng, sweeps):
+        """
+        One annealing run from a random placement.
+        Returns (best cells, best U, number of moves tried)
+        """
+        self._tables, self._kinds = self.energy_tables()
+        cells = rng.choice(self.N_CELLS, self.N_ATOMS, replace=False)
+        occupied = np.zeros(self.N_CELLS, dtype=bool)
+        occupied[cells] = True
+        energy = self.objective_values(cells[None, :])[0][0]
+
+        # start hot enough to accept a typical move from the random start
+        probes = [self.propose(cells, occupied, rng) for _ in range(100)]
+        deltas = [abs(self.delta_energy(cells, *p)) for p in probes if p is not None]
+        t_start = max(np.median(deltas) if deltas else 1, self.T_FINAL)
+
+        n_moves = sweeps * self.N_ATOMS
+        temperatures = np.geomspace(t_start, self.T_FINAL, n_moves)
+        thresholds = -temperatures * np.log(rng.random(n_moves))
+
+        best_cells, best_energy = cells.copy(), energy
+        for move_i in range(n_moves):
+            proposal = self.propose(cells, occupied, rng)
+            if proposal is None:
+                continue
+            moved, targets = proposal
+            delta = self.delta_energy(cells, moved, targets)
+
+            # metropolis, accept if delta < -T log(u)
+            if delta < thresholds[move_i]:
+                occupied[cells[moved]] = False
+                occupied[targets] = True
+                cells[moved] = targets
+                energy += delta
+                if energy < best_energy:
+                    best_cells, best_energy = cells.copy(), energy
+
+        # recompute from scratch to drop accumulated rounding
+        best_energy = self.objective_values(best_cells[None, :])[0][0]
+        return best_cells, best_energy, n_moves
+
+    def cells_to_solution(self, cells):
+        """
+        Returns the 0-1 vector in ij_to_q order for one spot per atom
+        """
+        return cells_to_samples(cells, self.N_CELLS)[0]
+
+    def solve(self, options):
+        """
+        Options:
+            'sweeps' - int, moves per atom in every anneal
+            'top_samples' - int, how many samples to print
+            'visualize' - boolean,
+            'repititions' - int, independent anneals, default 5
+            'seed' - int, default None
+            'instrument' - Instrument that records stage timings and
+                counters, default records nothing
+        """
+        DEFAULT_OPTIONS = {
+            'sweeps': self.SWEEPS,
+            'top_samples': 1,
+            'visualize': False,
+            'verbosity': 0,
+            'repititions': 5,
+            'seed': None,
+            'no_time': False,
+            'instrument': NULL_INSTRUMENT
+        }
+        complete_options = DEFAULT_OPTIONS.copy()
+        complete_options.update(options)
+
+        rng = np.random.default_rng(complete_options['seed'])
+        found, found_U = [], []
+        total_time = 0
+        instrument = complete_options['instrument']
+        for _ in range(complete_options['repititions']):
+            start_time = timer()
+            cells, U, n_moves = self.anneal(rng, complete_options['sweeps'])
+            end_time = timer()
+            total_time += end_time - start_time
+            found.append(cells)
+            found_U.append(U)
+            instrument.timing('sample', end_time - start_time)
+            instrument.count('moves', n_moves)
+
+            if not complete_options['no_time']:
+                print(f'time to solve: {end_time - start_time} s',
+                      f'({n_moves / (end_time - start_time):.0f} moves/s)')
+
+        # anneal already scored them, validity follows from the spots
+        results = ConformationBatch(found, self.LATTICE_LENGTH, U=found_U, solver='local').sorted()
+        for sample_i, conformation in enumerate(results[0:complete_options['top_samples']]):
+            print(f'------- sample {sample_i} -------')
+            print('solution is valid:', conformation.valid)
+            print('total U:', conformation.U)
+
+            if complete_options['visualize']:
+                self.plot_3d(self.cell_coordinates()[conformation.cells].astype(float))
+
+        if not complete_options['no_time']:
+            avg_time = total_time / complete_options['repititions']
+            print(f'average time: {avg_time} s')
+        return results
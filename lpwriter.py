@@ -1,53 +1,90 @@
-import os
+import io
+import tempfile
+import numpy as np
+from contextlib import contextmanager
 from pathlib import Path
-from pyomo.environ import *
-from pyomo.opt.base import ProblemFormat
 
 from problem import MolecularConformation
 
 
 class LpWriter(MolecularConformation):
-    def set_hyper_parameters(self):
-        cwd = Path(__file__).parents[0]
-        self.LP_FILEPATH = Path.joinpath(cwd, 'model.lp')
-
-    def write_model(self):
-        model = ConcreteModel()
-
-        model.B = self.N_ATOMS
-        model.N = self.N_CELLS
-
-        model.I = RangeSet(0, model.B - 1)
-        model.J = RangeSet(0, model.N - 1)
-        model.K = RangeSet(0, model.B - 1)
-        model.L = RangeSet(0, model.N - 1)
-
-        model.x = Var(model.I, model.J, within=Binary)
-
-        def actual_potential(model, i, j, k, l):
-            return model.x[i, j] * model.x[k, l] * self.potential_from_indices(i, j, k, l)
-
-        def objective_func(model):
-            return sum(
-                actual_potential(model, i, j, k, l)
-                for i in model.I for j in model.J
-                for k in model.K for l in model.L
-            )
-
-        def every_atom_in_one_place(model, i):
-            return sum(model.x[i, j] for j in model.J) == 1
-
-        model.InOneSpotCon = Constraint(model.I, rule=every_atom_in_one_place)
-
-        def no_more_than_one_atom_per_space(model, j):
-            return sum(model.x[i, j] for i in model.I) <= 1
-
-        model.AtMostOneAtomCon = Constraint(
-            model.J, rule=no_more_than_one_atom_per_space)
-
-        model.OBJ = Objective(rule=objective_func)
-
-        res = model.write(self.LP_FILEPATH, format=ProblemFormat.cpxlp)
-
-    def cleanup(self):
-        os.remove(self.LP_FILEPATH)
+    """
+    Writes the problem as a CPLEX LP file. Binary variable x[i, j] is
+    named x{ij_to_q(i, j) + 1}, the same names Pyomo gave them.
+    """
+
+    def write_model(self, out):
+        """
+        Streams the model to the text file object out, see model_text
+        and temporary_lp_file
+        """
+        out.write('\\* Source molecular conformation model *\\\n\n')
+        self.write_objective(out)
+        out.write('\ns.t.\n\n')
+        self.write_constraints(out)
+        self.write_variables(out)
+        out.write('end\n')
+
+    def model_text(self):
+        """
+        The LP file as a string, without touching the disk
+        """
+        out = io.StringIO()
+        self.write_model(out)
+        return out.getvalue()
+
+    @contextmanager
+    def temporary_lp_file(self):
+        """
+        Context manager writing the model to a file of its own, for
+        readers that need a path. Yields the path, the file is removed
+        on leaving even if the block raises
+        """
+        with tempfile.TemporaryDirectory(prefix='lpwriter-') as directory:
+            file_path = Path.joinpath(Path(directory), 'model.lp')
+            with open(file_path, 'w') as lp_file:
+                self.write_model(lp_file)
+            yield file_path
+
+    def write_objective(self, out):
+        """
+        sum over i, j, k, l of U_ijkl x_ij x_kl. Every unordered pair of
+        variables is written once with both orders summed, only if nonzero.
+        LP quadratic terms are halved by the closing / 2 so are written doubled
+        """
+        out.write('min\nobj:\n+ [\n')
+        j_all = np.repeat(np.arange(self.N_CELLS), self.N_CELLS)
+        l_all = np.tile(np.arange(self.N_CELLS), self.N_CELLS)
+        [j_near, l_near] = self.neighbor_pairs()
+        for i in range(self.N_ATOMS):
+            for k in range(i + 1, self.N_ATOMS):
+                [j, l] = [j_near, l_near] if k - i > 1 else [j_all, l_all]
+                coefficients = 4 * self.pair_table(i, k)[j, l]
+                nonzero = coefficients != 0
+                q = self.ij_to_q(i, j[nonzero]) + 1
+                r = self.ij_to_q(k, l[nonzero]) + 1
+                out.writelines(
+                    f'{c:+.17g} x{a} * x{b}\n'
+                    for c, a, b in zip(coefficients[nonzero].tolist(), q.tolist(), r.tolist())
+                )
+        out.write('] / 2\n')
+
+    def write_constraints(self, out):
+        for i in range(self.N_ATOMS):
+            # every atom in one place
+            out.write(f'c_e_InOneSpotCon({i})_:\n')
+            out.writelines(f'+1 x{self.ij_to_q(i, j) + 1}\n' for j in range(self.N_CELLS))
+            out.write('= 1\n\n')
+
+        for j in range(self.N_CELLS):
+            # no more than one atom per space
+            out.write(f'c_u_AtMostOneAtomCon({j})_:\n')
+            out.writelines(f'+1 x{self.ij_to_q(i, j) + 1}\n' for i in range(self.N_ATOMS))
+            out.write('<= 1\n\n')
+
+    def write_variables(self, out):
+        n_variables = self.N_ATOMS * self.N_CELLS
+        out.write('bounds\n')
+        out.writelines(f'   0 <= x{q} <= 1\n' for q in range(1, n_variables + 1))
+        out.write('binary\n')
+        out.writelines(f'  x{q}\n' for q in range(1, n_variables + 1))
@@ -0,0 +1,203 @@
+'''
+Coarse to fine solving on lattices of growing size. The hamiltonian has
+N_ATOMS * LATTICE_LENGTH ** 3 variables, doubling the lattice makes it 8
+times larger, while a fine lattice is what keeps the bond lengths close to
+bond_length. The molecule is solved on a coarse lattice spanning the same
+box, CELL_LENGTH scaled up, and every finer level only places every atom
+among the spots within a radius of where the level before put it, through
+make_bqm restricted to those spots. A large lattice then costs a few small
+problems instead of one large one.
+'''
+
+import numpy as np
+from timeit import default_timer as timer
+
+from conformation import ConformationBatch
+from dwavesolver import DwaveSolver, sample_repetition
+from instrumentation import NULL_INSTRUMENT
+
+# constants a level copies from the finest lattice, CELL_LENGTH is scaled
+CONSTANTS = ['A', 'B', 'CELL_LENGTH', 'SIGMA', 'e', 'bond_length', 'BETA',
+             'CUTOFF', 'CUTOFF_SHIFT', 'BOND_RADIUS']
+
+
+class MultiresolutionSolver(DwaveSolver):
+    def set_hyper_parameters(self):
+        super().set_hyper_parameters()
+        self.COARSEST = 3               # smallest lattice length of a level
+
+    def levels(self, coarsest=None):
+        """
+        The lattice lengths solved in turn, halving LATTICE_LENGTH down
+        to no less than coarsest and room for every atom, LATTICE_LENGTH last
+        """
+        coarsest = max(self.COARSEST if coarsest is None else coarsest, 2)
+        lengths = [self.LATTICE_LENGTH]
+        while lengths[0] // 2 >= coarsest and (lengths[0] // 2) ** 3 >= self.N_ATOMS:
+            lengths.insert(0, lengths[0] // 2)
+        return lengths
+
+    def level_problem(self, length):
+        """
+        The problem on a lattice of length spots per side spanning the
+        same box as this one, which is the problem itself at LATTICE_LENGTH
+        """
+        if length == self.LATTICE_LENGTH:
+            return self
+        problem = DwaveSolver(self.N_ATOMS, length)
+        for name in CONSTANTS:
+            setattr(problem, name, getattr(self, name))
+        problem.CELL_LENGTH = self.CELL_LENGTH * (self.LATTICE_LENGTH - 1) / (length - 1)
+        return problem
+
+    def map_cells(self, cells, coarse, fine):
+        """
+        The spots of fine nearest to the spots cells of coarse
+        """
+        scale = (fine.LATTICE_LENGTH - 1) / (coarse.LATTICE_LENGTH - 1)
+        coordinates = np.rint(coarse.cell_coordinates()[cells] * scale).astype(int)
+        return coordinates @ fine.LATTICE_LENGTH ** np.arange(3)
+
+    def refine(self, cells, coarse, fine, radius=None):
+        """
+        The spots of fine left for every atom, given its spot in cells on
+        coarse: the ones within radius fine cells of the nearest fine spot,
+        by default one coarse cell. Returns a list of arrays like
+        candidate_cells
+        """
+        radius = (fine.LATTICE_LENGTH - 1) / (coarse.LATTICE_LENGTH - 1) if radius is None else radius
+        coordinates = fine.cell_coordinates()
+        centers = coordinates[self.map_cells(cells, coarse, fine)]
+        distance = np.linalg.norm(coordinates[None, :, :] - centers[:, None, :], axis=2)
+        # the nearest spot is always in, whatever the radius
+        return [np.flatnonzero(within) for within in distance <= max(radius, 0)]
+
+    def solve_level(self, problem, cells, sample_options, seeds, solver=None,
+                    instrument=NULL_INSTRUMENT):
+        """
+        Samples the hamiltonian of problem restricted to cells (all of
+        it if None) once per seed, see sample_repetition. Returns
+        (ConformationBatch of the samples named solver, seconds spent sampling)
+        """
+        with instrument.span('build'):
+            Q = problem.make_bqm(cells)
+        instrument.count('variables', Q.num_variables)
+        instrument.count('couplings', Q.num_interactions)
+
+        batches, total_time = [], 0
+        for seed in seeds:
+            response, solve_time = sample_repetition(Q, sample_options, seed)
+            total_time += solve_time
+            instrument.timing('sample', solve_time)
+            batches.append(problem.sampleset_to_batch(response, solver=solver, instrument=instrument))
+        return ConformationBatch.concatenate(batches), total_time
+
+    def anchor(self, batch, previous=None):
+        """
+        The spots the next level refines: the best valid conformation of
+        batch, else its lowest energy sample with the atoms in no spot in
+        their spot in previous (on the same lattice), or in the middle spot
+        """
+        best = batch.best()
+        if best is not None:
+            return best.cells
+        cells = batch.sorted('energy')[0].cells.copy()
+        missing = cells < 0
+        if previous is not None:
+            cells[missing] = previous[missing]
+        else:
+            middle = batch.lattice_length // 2
+            cells[missing] = middle * (1 + batch.lattice_length + batch.lattice_length ** 2)
+        return cells
+
+    def solve(self, options):
+        """
+        Options:
+            'solver' - see solver input to Qbsolve.sample, default 'tabu'
+            'levels' - list of lattice lengths solved in turn, ending
+                with LATTICE_LENGTH, default levels()
+            'radius' - float, how far in fine cells an atom can move from
+                where the coarser level put it, default one coarse cell
+            'repititions' - int, runs at every level, default 5
+            'top_samples' - int, how many results to print
+            'visualize' - boolean,
+            'verbosity' - int, default 0 (low)
+            'seed' - int, default None
+            'tempering' - dict of parameters of a ParallelTemperingSampler
+                solver, see DwaveSolver.solve
+            'instrument' - Instrument that records stage timings and
+                counters, default records nothing
+        Returns a ConformationBatch of the samples of the last level,
+        lowest U first
+        """
+        DEFAULT_OPTIONS = {
+            'solver': 'tabu',
+            'levels': None,
+            'radius': None,
+            'repititions': 5,
+            'top_samples': 1,
+            'visualize': False,
+            'verbosity': 0,
+            'seed': None,
+            'tempering': {},
+            'no_time': False,
+            'instrument': NULL_INSTRUMENT
+        }
+        complete_options = DEFAULT_OPTIONS.copy()
+        complete_options.update(options)
+        instrument = complete_options['instrument']
+
+        levels = complete_options['levels'] or self.levels()
+        if levels[-1] != self.LATTICE_LENGTH:
+            levels = list(levels) + [self.LATTICE_LENGTH]
+
+        solver_name = complete_options['solver']
+        if not isinstance(solver_name, str):
+            solver_name = type(solver_name).__name__
+        sample_options = {
+            key: complete_options.get(key)
+            for key in ['verbosity', 'solver', 'solver_limit', 'tempering']
+        }
+
+        repititions = complete_options['repititions']
+        seeds = np.random.SeedSequence(complete_options['seed']).generate_state(
+            repititions * len(levels)) >> 1
+
+        coarse, cells, anchor, mapped = None, None, None, None
+        total_time = 0
+        for level, length in enumerate(levels):
+            problem = self.level_problem(length)
+            if coarse is not None:
+                cells = self.refine(anchor, coarse, problem, complete_options['radius'])
+                mapped = self.map_cells(anchor, coarse, problem)
+            n_variables = sum(map(len, cells)) if cells is not None else self.N_ATOMS * problem.N_CELLS
+
+            start_time = timer()
+            batch, solve_time = self.solve_level(
+                problem, cells, sample_options,
+                seeds[level * repititions:(level + 1) * repititions],
+                f'multires_{solver_name}', instrument
+            )
+            total_time += solve_time
+            anchor = self.anchor(batch, mapped)
+            coarse = problem
+
+            best = batch.best()
+            print(f'lattice {length} ({problem.CELL_LENGTH:.3f} A cells): {n_variables} variables,',
+                  f'best U {best.U if best is not None else None}')
+            if not complete_options['no_time']:
+                print(f'time to solve: {timer() - start_time} s ({solve_time} s sampling)')
+
+        results = batch.sorted()
+        for sample_i, conformation in enumerate(results[:complete_options['top_samples']]):
+            print(f'------- sample {sample_i} -------')
+            print('solution is valid:', conformation.valid)
+            print('energy:', conformation.energy)
+            print('total U:', conformation.U)
+
+            if complete_options['visualize']:
+                self.plot_3d(self.cells_to_positions(conformation.cells))
+
+        if not complete_options['no_time']:
+            print(f'total sampling time: {total_time} s')
+        return results
@@ -5,6 +5,7 @@ For comparison to gotten results
 '''
 
 import numpy as np
+from conformation import Conformation
 from dwavesolver import DwaveSolver
 from collections import defaultdict
 
@@ -24,5 +25,6 @@ solution[437] = 1
 positions = s.sample_to_positions(solution)
 # positions = np.array([[0, 3.0, 3], [1, 4, 2], [2, 3, 2], [2, 2, 2]])
 
-print("Energy:", s.objective_value(s.sample_to_x_ij_matrix(solution).flat))
+conformation = Conformation.from_solution(s, solution)
+print("Energy:", conformation.U, "valid:", conformation.valid)
 s.plot_3d(positions)
@@ -0,0 +1,394 @@
+'''
+Replica exchange (parallel tempering) sampler for any binary quadratic
+model. R replicas, one per temperature, are kept as one (n, R) array of
+0-1 states, a column per replica. A sweep visits the variables in order
+and tries to flip variable v in every replica at once. The local fields
+h + J x of all replicas are kept up to date, so a flip only touches the
+neighbours of v, and the energies are updated with the flips. After every
+sweep replicas at neighbouring temperatures swap states with the
+Metropolis probability, the cold replicas leave the minimum they are
+stuck in through the hot ones. During the first adapt_sweeps the inner
+temperatures are moved so that every neighbouring pair swaps about as
+often, the ladder then has no gap the states can not get across.
+The sweeps are compiled with numba if it is installed, else they are a
+NumPy loop over the variables, some 50 times slower.
+With workers > 1 the temperatures are split into blocks of neighbouring
+replicas, one per process, working on states in shared memory. A block
+swaps within itself after every sweep and with the blocks next to it
+every exchange_interval sweeps. Only that needs Python 3.8, for
+multiprocessing.shared_memory, one process runs on any version. On the
+lattice problems the compiled sweeps are too short for the processes to
+pay off, see the parallel tempering stages of benchmark.py.
+'''
+
+import multiprocessing
+import time
+import dimod
+import numpy as np
+
+try:
+    import numba
+except ImportError:     # the sweeps run as a NumPy loop over the variables
+    numba = None
+
+# (name, dtype, shape as a function of (n variables, R replicas))
+STATE_ARRAYS = [
+    ('X', np.int8, lambda n, R: (n, R)),          # states
+    ('F', np.float64, lambda n, R: (n, R)),       # local fields h + J x
+    ('E', np.float64, lambda n, R: (R,)),         # energies
+    ('best_X', np.int8, lambda n, R: (n, R)),     # lowest state every temperature saw
+    ('best_E', np.float64, lambda n, R: (R,)),
+    ('betas', np.float64, lambda n, R: (R,)),     # inverse temperatures, hottest first
+    ('swaps', np.int64, lambda n, R: (max(R - 1, 0),)),     # accepted swaps of (k, k + 1)
+    ('tries', np.int64, lambda n, R: (max(R - 1, 0),)),
+]
+
+
+def bqm_to_csr(bqm):
+    """
+    The BINARY bqm as (linear, (indptr, indices, values), offset), the
+    couplings symmetric in compressed sparse rows, variables in the order
+    of bqm.variables
+    """
+    if bqm.vartype is not dimod.BINARY:
+        bqm = bqm.change_vartype(dimod.BINARY, inplace=False)
+    n = bqm.num_variables
+    linear, (rows, cols, values), offset = bqm.to_numpy_vectors(
+        variable_order=list(bqm.variables))
+    rows, cols = np.concatenate([rows, cols]), np.concatenate([cols, rows])
+    rows, cols = rows.astype(np.int64), cols.astype(np.int64)
+    values = np.concatenate([values, values]).astype(np.float64)
+    order = np.argsort(rows, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+    return np.asarray(linear, dtype=np.float64), (indptr, cols[order], values[order]), float(offset)
+
+
+def default_betas(linear, csr, num_replicas):
+    """
+    Geometric inverse temperatures, hottest first, from accepting the
+    largest single flip half the time to accepting the smallest 1% of it,
+    the range neal anneals over
+    """
+    indptr, _, values = csr
+    row = np.repeat(np.arange(len(linear)), np.diff(indptr))
+    largest = np.abs(linear) + np.bincount(row, weights=np.abs(values), minlength=len(linear))
+    max_delta = largest.max() if len(largest) and largest.max() > 0 else 1.0
+    biases = np.abs(np.concatenate([linear, values]))
+    biases = biases[biases > 0]
+    min_delta = biases.min() if len(biases) else max_delta
+    hot, cold = np.log(2) / max_delta, np.log(100) / min_delta
+    if num_replicas == 1:
+        return np.array([cold])
+    return np.geomspace(hot, cold, num_replicas)
+
+
+def adapt_betas(betas, swap_rate, damping=0.5):
+    """
+    Moves the inner betas so that the swap rates even out, the gaps in
+    log beta with few swaps shrink and those where nearly every swap is
+    accepted grow. The hottest and the coldest beta stay
+    """
+    gaps = np.diff(np.log(betas))
+    wanted = gaps * (swap_rate + 0.05)
+    wanted *= gaps.sum() / wanted.sum()
+    gaps = damping * gaps + (1 - damping) * wanted
+    adapted = betas[0] * np.exp(np.concatenate([[0], np.cumsum(gaps)]))
+    adapted[-1] = betas[-1]
+    return adapted
+
+
+def local_fields(linear, csr, X):
+    """
+    h + J x of the (n, R) states X
+    """
+    indptr, indices, values = csr
+    row = np.repeat(np.arange(len(linear)), np.diff(indptr))
+    F = np.repeat(linear[:, None], X.shape[1], axis=1)
+    np.add.at(F, row, values[:, None] * X[indices])
+    return F
+
+
+def energies(linear, offset, X, F):
+    """
+    Energies of the (n, R) states X with local fields F, every coupling
+    is in F twice
+    """
+    return offset + (linear @ X + (X * F).sum(axis=0)) / 2
+
+
+def _metropolis_numpy(X, F, E, thresholds, indptr, indices, values):
+    """
+    Flips variable v of every replica whose energy change is below its
+    threshold, in turn for every v, the flips of all replicas at once
+    """
+    for v in range(X.shape[0]):
+        x = X[v]
+        delta = (1 - 2 * x) * F[v]
+        flip = np.flatnonzero(delta < thresholds[v])
+        if len(flip) == 0:
+            continue
+        E[flip] += delta[flip]
+        step = 1 - 2 * x[flip]      # +1 for 0 -> 1
+        X[v, flip] += step
+        start, end = indptr[v], indptr[v + 1]
+        if end > start:
+            F[np.ix_(indices[start:end], flip)] += values[start:end, None] * step
+
+
+def _metropolis_loops(X, F, E, thresholds, indptr, indices, values):
+    """
+    _metropolis_numpy as plain loops for numba to compile, the same
+    flips in the same order
+    """
+    n, R = X.shape
+    for v in range(n):
+        for r in range(R):
+            step = 1 - 2 * X[v, r]
+            delta = step * F[v, r]
+            if delta < thresholds[v, r]:
+                E[r] += delta
+                X[v, r] += step
+                for p in range(indptr[v], indptr[v + 1]):
+                    F[indices[p], r] += values[p] * step
+
+
+# a Python loop over the variables costs about as much as a compiled sweep
+# over all of them, so the sweeps are compiled when numba is there
+metropolis = _metropolis_numpy if numba is None else numba.njit(cache=True)(_metropolis_loops)
+
+
+def sweep(state, betas, csr, rng):
+    """
+    One Metropolis sweep over the variables of every replica of state
+    """
+    X, F, E = state['X'], state['F'], state['E']
+    # flip when the energy change is below -log(u) / beta
+    thresholds = -np.log(rng.random(X.shape)) / betas
+    metropolis(X, F, E, thresholds, *csr)
+    improved = np.flatnonzero(E < state['best_E'])
+    state['best_X'][:, improved] = X[:, improved]
+    state['best_E'][improved] = E[improved]
+
+
+def exchange(state, betas, pairs, rng):
+    """
+    Swaps the states of the replicas (k, k + 1) for k in pairs with
+    probability min(1, exp((beta_k+1 - beta_k) (E_k+1 - E_k)))
+    """
+    if len(pairs) == 0:
+        return
+    E = state['E']
+    accept = np.log(rng.random(len(pairs))) < (betas[pairs + 1] - betas[pairs]) * (E[pairs + 1] - E[pairs])
+    state['tries'][pairs] += 1
+    state['swaps'][pairs[accept]] += 1
+    k = pairs[accept]
+    a, b = np.concatenate([k, k + 1]), np.concatenate([k + 1, k])
+    for name in ['X', 'F']:
+        state[name][:, a] = state[name][:, b]
+    E[a] = E[b]
+
+
+def _block(state, start, end):
+    """
+    Views of the replicas start .. end - 1 of state
+    """
+    block = {}
+    for name, _, _ in STATE_ARRAYS:
+        array = state[name]
+        if name in ['swaps', 'tries']:
+            block[name] = array[start:max(end - 1, start)]
+        elif array.ndim == 2:
+            block[name] = array[:, start:end]
+        else:
+            block[name] = array[start:end]
+    return block
+
+
+def run_block(state, start, end, csr, config, rng, control):
+    """
+    Sweeps the replicas start .. end - 1 of state. control holds the
+    shared target time and sweep, the stop flag and a barrier. The block
+    that starts at 0 also swaps across the block borders and adapts the
+    betas, the swap counts start over once they are fixed
+    """
+    block = _block(state, start, end)
+    betas, block_betas = state['betas'], block['betas']
+    num_sweeps, interval = config['num_sweeps'], config['exchange_interval']
+    target, adapt_sweeps = config['target_energy'], config['adapt_sweeps']
+    counted = (state['swaps'].copy(), state['tries'].copy())
+
+    done = 0
+    while done < num_sweeps:
+        for _ in range(min(interval, num_sweeps - done)):
+            sweep(block, block_betas, csr, rng)
+            done += 1
+            # alternate the even and the odd pairs, counted over all replicas
+            first = (done - start) % 2
+            exchange(block, block_betas, np.arange(first, end - start - 1, 2), rng)
+            if target is not None and control['target_sweep'].value < 0 and block['E'].min() <= target:
+                with control['target_sweep'].get_lock():
+                    if control['target_sweep'].value < 0:
+                        control['target_sweep'].value = done
+                        control['target_time'].value = time.monotonic() - config['start']
+
+        barrier = control['barrier']
+        if barrier is not None:
+            barrier.wait()
+        if start == 0:
+            borders = np.array(config['borders'][1:-1], dtype=int) - 1
+            exchange(state, betas, borders, rng)
+            if done <= adapt_sweeps:
+                swaps, tries = state['swaps'] - counted[0], state['tries'] - counted[1]
+                # every pair, also across the borders, needs a few tries
+                if len(tries) and tries.min() >= 10:
+                    betas[:] = adapt_betas(betas, swaps / tries)
+                    counted = (state['swaps'].copy(), state['tries'].copy())
+            elif done - interval < adapt_sweeps:
+                state['swaps'][:] = 0
+                state['tries'][:] = 0
+            if target is not None and control['target_sweep'].value >= 0:
+                control['stop'].value = True
+        if barrier is not None:
+            barrier.wait()
+        if control['stop'].value:
+            break
+    return done
+
+
+def _worker(names, shape, start, end, csr, config, rng, control):
+    from multiprocessing import shared_memory
+    segments = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        state = {
+            name: np.ndarray(make_shape(*shape), dtype=dtype, buffer=segment.buf)
+            for (name, dtype, make_shape), segment in zip(STATE_ARRAYS, segments)
+        }
+        run_block(state, start, end, csr, config, rng, control)
+        del state
+    finally:
+        for segment in segments:
+            segment.close()
+
+
+class ParallelTemperingSampler(dimod.Sampler):
+    """
+    Replica exchange sampler, see the module docstring. The samples are
+    the lowest state every temperature saw, hottest first
+    """
+    parameters = {
+        'num_replicas': [],
+        'num_sweeps': [],
+        'betas': [],
+        'adapt_sweeps': [],
+        'exchange_interval': [],
+        'workers': [],
+        'target_energy': [],
+        'initial_states': [],
+        'seed': [],
+    }
+    properties = {}
+
+    def sample(self, bqm, num_replicas=32, num_sweeps=1000, betas=None, adapt_sweeps=None,
+               exchange_interval=10, workers=1, target_energy=None, initial_states=None, seed=None):
+        """
+        betas - num_replicas inverse temperatures, hottest first, default
+            default_betas
+        adapt_sweeps - sweeps the betas are adapted for, default a
+            quarter of num_sweeps, 0 keeps them
+        exchange_interval - sweeps between swaps across the blocks of the workers
+        workers - processes the replicas are split over, more than
+            one needs Python 3.8 and is slower than one on the lattice
+            problems
+        target_energy - sampling stops once a replica reaches it, the
+            time and sweep it took are in info['time_to_target'] and
+            info['sweeps_to_target'] (None if it was not reached)
+        initial_states - (num_replicas, n) 0-1 states in the order of
+            bqm.variables, e.g. info['final_states'] of an earlier run,
+            default random
+        The info also has the final betas and the acceptance rate of the
+        swaps between every pair of neighbouring temperatures after them
+        """
+        start_time = time.monotonic()
+        linear, csr, offset = bqm_to_csr(bqm)
+        n = len(linear)
+        seeds = np.random.SeedSequence(seed).spawn(workers + 1)
+        rng = np.random.default_rng(seeds[0])
+        betas = default_betas(linear, csr, num_replicas) if betas is None else np.asarray(betas, dtype=float)
+        num_replicas = len(betas)
+        workers = max(1, min(workers, num_replicas))
+
+        if initial_states is None:
+            X = rng.integers(0, 2, (n, num_replicas), dtype=np.int8)
+        else:
+            X = np.ascontiguousarray(np.asarray(initial_states, dtype=np.int8).T)
+        F = local_fields(linear, csr, X)
+        E = energies(linear, offset, X, F)
+
+        config = {
+            'num_sweeps': num_sweeps,
+            'adapt_sweeps': num_sweeps // 4 if adapt_sweeps is None else adapt_sweeps,
+            'exchange_interval': exchange_interval,
+            'target_energy': target_energy,
+            'start': start_time,
+            'borders': np.linspace(0, num_replicas, workers + 1).astype(int).tolist(),
+        }
+        control = {
+            'target_sweep': multiprocessing.Value('q', -1),
+            'target_time': multiprocessing.Value('d', -1.0),
+            'stop': multiprocessing.Value('b', False),
+            'barrier': multiprocessing.Barrier(workers) if workers > 1 else None,
+        }
+
+        if workers > 1:
+            from multiprocessing import shared_memory
+        initial = {'X': X, 'F': F, 'E': E, 'best_X': X, 'best_E': E, 'betas': betas}
+        segments = []
+        try:
+            state = {}
+            for name, dtype, make_shape in STATE_ARRAYS:
+                shape = make_shape(n, num_replicas)
+                if workers > 1:
+                    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+                    segments.append(shared_memory.SharedMemory(create=True, size=size))
+                    state[name] = np.ndarray(shape, dtype=dtype, buffer=segments[-1].buf)
+                else:
+                    state[name] = np.zeros(shape, dtype=dtype)
+                state[name][...] = initial.get(name, 0)
+
+            borders = config['borders']
+            if workers > 1:
+                names = [segment.name for segment in segments]
+                processes = [
+                    multiprocessing.Process(target=_worker, args=(
+                        names, (n, num_replicas), borders[w], borders[w + 1], csr,
+                        config, np.random.default_rng(seeds[w + 1]), control))
+                    for w in range(workers)
+                ]
+                for process in processes:
+                    process.start()
+                for process in processes:
+                    process.join()
+                if any(process.exitcode != 0 for process in processes):
+                    raise RuntimeError('parallel tempering worker failed')
+            else:
+                run_block(state, 0, num_replicas, csr, config,
+                          np.random.default_rng(seeds[1]), control)
+
+            best_X, final_X = state['best_X'].T.copy(), state['X'].T.copy()
+            betas = state['betas'].copy()
+            swap_rate = state['swaps'] / np.maximum(state['tries'], 1)
+        finally:
+            state = None
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+        reached = control['target_sweep'].value >= 0
+        info = {
+            'betas': betas,
+            'swap_rate': swap_rate,
+            'final_states': final_X,
+            'time_to_target': control['target_time'].value if reached else None,
+            'sweeps_to_target': control['target_sweep'].value if reached else None,
+        }
+        return dimod.SampleSet.from_samples_bqm((best_X, list(bqm.variables)), bqm, info=info)
@@ -0,0 +1,160 @@
+'''
+Calibrates the penalty weight A of the constraints against the weight B of
+the objective. The constraint and objective terms are built once and only
+reweighted for every setting, then sampled with the chosen solver, and the
+rate of valid samples and their U are reported for every ratio A / B.
+Either a grid of ratios is run or, with --target, a bisection for the
+smallest ratio whose valid rate reaches the target.
+'''
+
+import argparse
+import json
+import numpy as np
+from pathlib import Path
+from timeit import default_timer as timer
+
+from conformation import ConformationBatch
+from dwavesolver import DwaveSolver, sample_repetition
+from solvers import SOLVERS, make_sampler
+
+RATIOS = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+# samplers DwaveSolver runs on the whole hamiltonian, the decomposing
+# solvers only borrow one for their sub-problems
+WHOLE_QUBO_SOLVERS = [name for name, spec in SOLVERS.items() if spec.class_name == 'DwaveSolver']
+
+
+class PenaltySweep:
+    def __init__(self, solver, sampler, solver_name, repititions=5, seed=None,
+                 prune=False, solver_limit=None):
+        self.solver = solver
+        self.solver_name = solver_name
+        self.repititions = repititions
+        self.seed = seed
+        self.cells = solver.candidate_cells() if prune else None
+        self.options = {'verbosity': -1, 'solver': sampler, 'solver_limit': solver_limit}
+
+        start_time = timer()
+        self.components = solver.make_components(self.cells)
+        self.build_time = timer() - start_time
+        self.results = {}
+
+    def evaluate(self, ratio):
+        """
+        Samples the hamiltonian with A = ratio * B and returns its report,
+        every ratio is only sampled once
+        """
+        if ratio in self.results:
+            return self.results[ratio]
+
+        start_time = timer()
+        B = self.solver.B
+        coo = self.solver.combine_components(self.components, ratio * B, B)
+        bqm = self.solver.coo_to_bqm(coo, self.cells)
+
+        # the same seeds for every ratio, so only the weights differ
+        seeds = np.random.SeedSequence(self.seed).generate_state(self.repititions) >> 1
+        batch = ConformationBatch.concatenate(
+            ConformationBatch.from_samples(
+                self.solver, sample_repetition(bqm, self.options, seed)[0], solver=self.solver_name)
+            for seed in seeds
+        )
+
+        valid_U = batch.U[batch.valid]
+        report = {
+            'ratio': ratio,
+            'A': ratio * B,
+            'B': B,
+            'samples': len(batch),
+            'valid_rate': float(batch.valid.mean()),
+            'best_U': float(valid_U.min()) if len(valid_U) else None,
+            'mean_U': float(valid_U.mean()) if len(valid_U) else None,
+            'time': timer() - start_time,
+        }
+        self.results[ratio] = report
+        return report
+
+    def grid(self, ratios):
+        return [self.evaluate(ratio) for ratio in ratios]
+
+    def bisect(self, target, low, high, steps):
+        """
+        Bisects ratio on a log scale for the smallest one whose valid
+        rate is at least target, assuming the rate grows with the ratio.
+        Returns that ratio, None if even high falls short
+        """
+        if self.evaluate(high)['valid_rate'] < target:
+            return None
+        if self.evaluate(low)['valid_rate'] >= target:
+            return low
+        for _ in range(steps):
+            middle = float(np.sqrt(low * high))
+            if self.evaluate(middle)['valid_rate'] >= target:
+                high = middle
+            else:
+                low = middle
+        return high
+
+    def reports(self):
+        return [self.results[ratio] for ratio in sorted(self.results)]
+
+
+def print_report(report):
+    best_U = 'none valid' if report['best_U'] is None else f"{report['best_U']:.6g}"
+    mean_U = '' if report['mean_U'] is None else f"{report['mean_U']:.6g}"
+    print(f"{report['ratio']:10.4g} {report['A']:12.6g} {report['valid_rate']:8.1%}"
+          f" {best_U:>12} {mean_U:>12} {report['time']:8.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-B', '--num_molecules', type=int, default=4)
+    parser.add_argument('-L', '--lattice_size', type=int, default=4)
+    parser.add_argument('-s', '--solver', type=str, default='tabu',
+                        choices=WHOLE_QUBO_SOLVERS,
+                        help='sampler to calibrate for. Default "tabu"')
+    parser.add_argument('-r', '--ratios', type=float, nargs='+', default=RATIOS,
+                        help='ratios A / B to try. Default ' + ' '.join(str(r) for r in RATIOS))
+    parser.add_argument('--target', type=float, default=None,
+                        help='bisect between the smallest and largest ratio for the smallest'
+                             ' one with at least this valid rate instead of running the grid')
+    parser.add_argument('--steps', type=int, default=6,
+                        help='bisection steps with --target. Default 6')
+    parser.add_argument('-n', '--repititions', type=int, default=5,
+                        help='solver runs per ratio. Default 5')
+    parser.add_argument('--sub-size', dest='sub_size', type=int, default=None,
+                        help='qbsolv sub-QUBO size. Default qbsolv\'s')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--prune', action='store_true',
+                        help='sample only the variables left by candidate_cells')
+    parser.add_argument('-o', '--output', type=Path, default=None,
+                        help='JSON file to save the reports to')
+    args = parser.parse_args()
+
+    solver = DwaveSolver(args.num_molecules, args.lattice_size)
+    sweep = PenaltySweep(solver, make_sampler(args.solver), args.solver, args.repititions,
+                         args.seed, args.prune, args.sub_size)
+    print(f'built the hamiltonian terms in {sweep.build_time:.2f} s,'
+          f' the default ratio is {solver.A / solver.B:.4g}')
+
+    print(f"{'A / B':>10} {'A':>12} {'valid':>8} {'best U':>12} {'mean U':>12} {'time':>10}")
+    if args.target is None:
+        for report in sweep.grid(sorted(args.ratios)):
+            print_report(report)
+    else:
+        ratio = sweep.bisect(args.target, min(args.ratios), max(args.ratios), args.steps)
+        for report in sweep.reports():
+            print_report(report)
+        if ratio is None:
+            print(f'no ratio up to {max(args.ratios)} reaches a valid rate of {args.target:.0%}')
+        else:
+            print(f'smallest ratio with a valid rate of {args.target:.0%}: {ratio:.4g}')
+
+    if args.output is not None:
+        with open(args.output, 'w') as out_file:
+            json.dump({
+                'n_atoms': args.num_molecules,
+                'lattice_length': args.lattice_size,
+                'solver': args.solver,
+                'build_time': sweep.build_time,
+                'reports': sweep.reports()
+            }, out_file, indent=2)
@@ -0,0 +1,172 @@
+'''
+Encodings of the spot of an atom in fewer binary variables than the
+N_CELLS of one-hot. A spot is split into digits, e.g. the bits of its index
+or its three coordinates, and every digit value is told apart by a few
+variables. The indicator of a digit value is an affine function of the
+digit's variables, so the indicator x_ij of a spot is a product over the
+digits and the hamiltonian becomes a polynomial of higher order.
+
+Every digit has a matrix M of size (size, width + 1). Row v holds the
+coefficients of the indicator of value v in the basis (1, v_1, ..., v_width).
+'''
+
+import math
+import operator
+import numpy as np
+from functools import reduce
+
+
+class BitDigit:
+    """
+    One bit of the spot index, 1 - y for 0 and y for 1
+    """
+    size = 2
+    width = 1
+    M = np.array([[1, -1], [0, 1]])
+
+    def decode(self, values):
+        return values[..., 0].astype(int)
+
+    def penalty(self, A):
+        return []
+
+
+class DomainWallDigit:
+    """
+    One coordinate in 0 .. L - 1 as a domain wall over L - 1 variables,
+    d_1 >= d_2 >= ... >= d_(L-1) and the coordinate is their sum.
+    With d_0 = 1 and d_L = 0 the indicator of value c is d_c - d_(c+1)
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.width = size - 1
+        self.M = np.zeros((size, size), dtype=int)
+        for c in range(size):
+            self.M[c, c] = 1
+            if c + 1 < size:
+                self.M[c, c + 1] = -1
+
+    def decode(self, values):
+        value = values.sum(axis=-1).astype(int)
+        walled = (values[..., :-1] >= values[..., 1:]).all(axis=-1)
+        return np.where(walled, value, -1)
+
+    def penalty(self, A):
+        """
+        A for every place the wall is broken, d_(m+1) (1 - d_m).
+        Terms as (local variable indices, coefficient)
+        """
+        terms = []
+        for m in range(self.width - 1):
+            terms.append(((m + 1,), A))
+            terms.append(((m, m + 1), -A))
+        return terms
+
+
+class Encoding:
+    """
+    The spot of one atom as digits. The spot index is the digit values read
+    as a number, most significant digit first, with digit sizes as the base.
+    Codes beyond the last spot are not a spot
+    """
+
+    def __init__(self, name, digits, n_cells):
+        self.name = name
+        self.digits = digits
+        self.n_cells = n_cells
+        self.shape = tuple(digit.size for digit in digits)
+        self.n_codes = reduce(operator.mul, self.shape, 1)
+        self.offsets = np.cumsum([0] + [digit.width for digit in digits])
+        self.width = int(self.offsets[-1])      # variables per atom
+
+    def cell_table(self, table):
+        """
+        Reshapes an array with axes of length N_CELLS so that every such
+        axis becomes one axis per digit, codes that are no spot are 0
+        """
+        table = np.asarray(table, dtype=float)
+        padding = [(0, self.n_codes - self.n_cells)] * table.ndim
+        table = np.pad(table, padding)
+        return table.reshape(self.shape * table.ndim)
+
+    def expand(self, table, absolute=False):
+        """
+        Expands a table from cell_table into the coefficients of its
+        polynomial. Axis a of the result indexes (1, v_1, ..., v_width) of
+        digit a % len(digits) of the (a // len(digits))-th atom.
+        With absolute the magnitudes are summed instead, which bounds the
+        rounding error of every coefficient
+        """
+        coefficients = table
+        for a in range(table.ndim):
+            M = self.digits[a % len(self.digits)].M
+            if absolute:
+                M = np.abs(M)
+            # contracts the leading axis, the new axis goes last
+            coefficients = np.tensordot(coefficients, M, axes=([0], [0]))
+        return coefficients
+
+    def variables(self, index):
+        """
+        For an array of multi-indices into an expanded table of one atom
+        (len(digits) columns), the local variable of every column or -1
+        where the index is the constant 1
+        """
+        index = np.asarray(index)
+        offsets = np.tile(self.offsets[:-1], index.shape[-1] // len(self.digits))
+        return np.where(index > 0, offsets + index - 1, -1)
+
+    def penalty(self, A):
+        """
+        The penalty terms of one atom in local variable indices: A for
+        every broken digit and A for a code that is no spot
+        """
+        terms = []
+        for digit, offset in zip(self.digits, self.offsets):
+            terms += [(tuple(offset + v for v in local), bias) for local, bias in digit.penalty(A)]
+        if self.n_codes > self.n_cells:
+            invalid = np.zeros(self.n_codes)
+            invalid[self.n_cells:] = A
+            coefficients = self.expand(invalid.reshape(self.shape))
+            for index in zip(*np.nonzero(coefficients)):
+                local = self.variables(np.array(index))
+                terms.append((tuple(local[local >= 0]), coefficients[index]))
+        return terms
+
+    def decode(self, values):
+        """
+        (S, N_ATOMS * width) 0-1 values to the (S, N_ATOMS) spots,
+        -1 where a digit is broken or the code is no spot
+        """
+        values = np.asarray(values)
+        values = values.reshape(len(values), values.shape[1] // self.width, self.width)
+        cells = np.zeros(values.shape[:2], dtype=int)
+        broken = np.zeros(values.shape[:2], dtype=bool)
+        for digit, start, end in zip(self.digits, self.offsets[:-1], self.offsets[1:]):
+            digit_value = digit.decode(values[..., start:end])
+            broken |= digit_value < 0
+            cells = cells * digit.size + digit_value
+        return np.where(broken | (cells >= self.n_cells), -1, cells)
+
+
+def binary_encoding(n_cells, lattice_length):
+    """
+    The spot index in ceil(log2 N_CELLS) bits
+    """
+    n_bits = max(1, math.ceil(math.log2(n_cells)))
+    return Encoding('binary', [BitDigit() for _ in range(n_bits)], n_cells)
+
+
+def domain_wall_encoding(n_cells, lattice_length):
+    """
+    Every coordinate as a domain wall, 3 (L - 1) variables. Spot
+    z L^2 + y L + x so the z coordinate is the first digit
+    """
+    return Encoding('domain_wall', [DomainWallDigit(lattice_length) for _ in range(3)], n_cells)
+
+
+ENCODINGS = {
+    'binary': binary_encoding,
+    'domain_wall': domain_wall_encoding,
+}
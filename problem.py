@@ -1,6 +1,6 @@
+from conformation import Conformation
 from helpers import EquationsMixin, UtilsMixin
-import json
-from pathlib import Path
+from resultstore import ResultStore
 
 
 class MolecularConformation(EquationsMixin, UtilsMixin):
@@ -17,6 +17,9 @@ class MolecularConformation(EquationsMixin, UtilsMixin):
         self.e = 0.06                   # kcal
         self.bond_length = 1.526          # A approximate
         self.BETA = 50             # scalar for bond stretching penalty
+        self.CUTOFF = None              # A, LJ beyond this distance is dropped
+        self.CUTOFF_SHIFT = False       # shift LJ so it is 0 at the cutoff
+        self.BOND_RADIUS = 3.2          # A, furthest bonded atoms are apart when pruning
 
     def set_problem_parameters(self, N_ATOMS, LATTICE_LENGTH):
         self.N_ATOMS = N_ATOMS         # B in paper
@@ -31,22 +34,11 @@ class MolecularConformation(EquationsMixin, UtilsMixin):
         pass
 
     def save_result(self, solver_type, solution):
-        cwd = Path(__file__).parents[0]
-        data = []
-        file_path = Path.joinpath(cwd, "results/aggregated.json")
-        with open(file_path, 'r') as in_file:
-            data = json.load(in_file)
-
-        results = []
-        size_str = f'{self.N_ATOMS}x{self.LATTICE_LENGTH}'
-        try:
-            results = data[solver_type][size_str]
-        except KeyError:
-            data[solver_type][size_str] = results
-        indices = list(map(
-            lambda t: t[0],
-            filter(lambda t: t[1] == 1, enumerate(solution))
-        ))
-        results.append(indices)
-        with open(file_path, 'w') as out_file:
-            json.dump(data, out_file)
+        """
+        Appends a Conformation or a 0-1 solution vector to the results store
+        """
+        with ResultStore() as store:
+            if isinstance(solution, Conformation):
+                store.add_conformation(solution, solver_type)
+            else:
+                store.add_solution(self, solver_type, solution)
@@ -10,14 +10,14 @@ load_dotenv()
 
 
 class QiskitSolver(LpWriter):
-    def solve(self):
-        # self.write_model()
+    def solve(self, options=None):
         # IBMQ.enable_account(os.getenv('IBM_TOKEN'))
         backend = BasicAer.get_backend('ibmq_qasm_simulator')
         # backend = Aer.get_backend('qasm_simulator')
         prog = QuadraticProgram("molecConform")
 
-        prog.read_from_lp_file(str(self.LP_FILEPATH))
+        with self.temporary_lp_file() as lp_path:
+            prog.read_from_lp_file(str(lp_path))
         optimizer = GroverOptimizer(3, quantum_instance=backend)
         results = optimizer.solve(prog)
         print(results)
@@ -0,0 +1,121 @@
+'''
+On-disk cache of built hamiltonians in (rows, cols, values) coordinate form.
+An entry is a directory of .npy files named by a hash of every parameter the
+hamiltonian depends on, so changing any constant gives a new entry.
+Entries are written under a temporary name and renamed into place, readers
+never see a half written entry, and are memory-mapped on load.
+The least recently used entries are removed once the cache is over its size.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+from pathlib import Path
+
+DEFAULT_DIR = Path.joinpath(Path(__file__).parents[0], 'results/qubo_cache')
+FORMAT_VERSION = 1
+ARRAYS = ['rows', 'cols', 'values']
+
+
+class QuboCache:
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=2 * 1024 ** 3):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, problem, cells=None):
+        """
+        Hash of everything the hamiltonian of problem depends on
+        """
+        parameters = {
+            'version': FORMAT_VERSION,
+            'class': type(problem).__name__,
+            'cells': None if cells is None else [np.asarray(c).tolist() for c in cells],
+        }
+        for name in ['N_ATOMS', 'LATTICE_LENGTH', 'A', 'B', 'CELL_LENGTH', 'SIGMA',
+                     'e', 'bond_length', 'BETA', 'CUTOFF', 'CUTOFF_SHIFT']:
+            parameters[name] = getattr(problem, name, None)
+        encoded = json.dumps(parameters, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def load(self, key):
+        """
+        The memory-mapped (rows, cols, values) of an entry, None if missing
+        """
+        entry = Path.joinpath(self.directory, key)
+        try:
+            arrays = tuple(
+                np.load(Path.joinpath(entry, f'{name}.npy'), mmap_mode='r')
+                for name in ARRAYS
+            )
+            # mark as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return arrays
+
+    def store(self, key, coo):
+        """
+        Writes an entry, if another process stored the same key
+        first its entry is kept
+        """
+        temporary = Path.joinpath(self.directory, f'.tmp-{uuid.uuid4().hex}')
+        temporary.mkdir()
+        for name, array in zip(ARRAYS, coo):
+            np.save(Path.joinpath(temporary, f'{name}.npy'), np.asarray(array))
+        try:
+            os.rename(temporary, Path.joinpath(self.directory, key))
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+        self.evict()
+
+    def coo(self, problem, cells=None):
+        """
+        The hamiltonian of problem from the cache, built with make_coo
+        and stored if it is not there. A freshly built one is returned as
+        built, storing it may evict it right away when it alone is over
+        max_bytes
+        """
+        key = self.key(problem, cells)
+        arrays = self.load(key)
+        if arrays is None:
+            arrays = problem.make_coo(cells)
+            self.store(key, arrays)
+        return arrays
+
+    def entries(self):
+        """
+        (last used, size in bytes, path) of every entry, oldest first
+        """
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.name.startswith('.'):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                continue    # removed by another process meanwhile
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in
+        max_bytes. Processes that already mapped an entry keep reading it
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            # rename first so no reader finds a half removed entry
+            doomed = Path.joinpath(self.directory, f'.del-{uuid.uuid4().hex}')
+            try:
+                os.rename(entry, doomed)
+            except OSError:
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
@@ -0,0 +1,268 @@
+'''
+Append-only store for solver results backed by SQLite in WAL mode.
+Any number of processes can add results at the same time, every insert
+is its own short transaction and nothing already stored is rewritten.
+'''
+
+import argparse
+import json
+import re
+import sqlite3
+import time
+import numpy as np
+from pathlib import Path
+
+from conformation import Conformation, ConformationBatch
+
+RESULTS_DIR = Path.joinpath(Path(__file__).parents[0], 'results')
+DEFAULT_FILEPATH = Path.joinpath(RESULTS_DIR, 'results.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    job TEXT UNIQUE,
+    solver TEXT NOT NULL,
+    n_atoms INTEGER NOT NULL,
+    lattice_length INTEGER NOT NULL,
+    cells TEXT NOT NULL,
+    energy REAL,
+    U REAL,
+    valid INTEGER,
+    source TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_solver_size
+    ON results (solver, n_atoms, lattice_length);
+CREATE INDEX IF NOT EXISTS results_size_U
+    ON results (n_atoms, lattice_length, U);
+CREATE INDEX IF NOT EXISTS results_size_energy
+    ON results (n_atoms, lattice_length, energy);
+'''
+
+COLUMNS = ['id', 'job', 'solver', 'n_atoms', 'lattice_length', 'cells',
+           'energy', 'U', 'valid', 'source', 'created']
+
+
+class ResultStore:
+    def __init__(self, file_path=DEFAULT_FILEPATH):
+        self.file_path = Path(file_path)
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        # wait on other writers instead of failing straight away
+        self.connection = sqlite3.connect(str(self.file_path), timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, solver, n_atoms, lattice_length, cells,
+            energy=None, U=None, valid=None, job=None, source=None):
+        """
+        Appends one result, cells is the spot of every atom in order.
+        Returns the id of the new row
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO results (job, solver, n_atoms, lattice_length, cells,'
+                ' energy, U, valid, source, created)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job, solver, n_atoms, lattice_length,
+                 json.dumps([int(c) for c in cells]),
+                 None if energy is None else float(energy),
+                 None if U is None else float(U),
+                 None if valid is None else int(valid),
+                 source, time.time())
+            )
+        return cursor.lastrowid
+
+    def query(self, solver=None, n_atoms=None, lattice_length=None,
+              max_U=None, valid=None, limit=None):
+        """
+        Results matching every given filter, lowest U first.
+        Returns a list of dicts with the cells decoded
+        """
+        filters, values = [], []
+        for column, value in [('solver', solver), ('n_atoms', n_atoms),
+                              ('lattice_length', lattice_length), ('valid', valid)]:
+            if value is not None:
+                filters.append(f'{column} = ?')
+                values.append(int(value) if column == 'valid' else value)
+        if max_U is not None:
+            filters.append('U <= ?')
+            values.append(max_U)
+
+        sql = f'SELECT {", ".join(COLUMNS)} FROM results'
+        if filters:
+            sql += ' WHERE ' + ' AND '.join(filters)
+        sql += ' ORDER BY U IS NULL, U, id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            values.append(limit)
+
+        rows = []
+        for row in self.connection.execute(sql, values):
+            row = dict(zip(COLUMNS, row))
+            row['cells'] = json.loads(row['cells'])
+            rows.append(row)
+        return rows
+
+    def finished_jobs(self):
+        """
+        Keys of every stored result that came from a named job
+        """
+        return {job for (job,) in self.connection.execute(
+            'SELECT job FROM results WHERE job IS NOT NULL')}
+
+    def contains(self, solver, n_atoms, lattice_length, cells):
+        return self.connection.execute(
+            'SELECT 1 FROM results WHERE solver = ? AND n_atoms = ?'
+            ' AND lattice_length = ? AND cells = ? LIMIT 1',
+            (solver, n_atoms, lattice_length, json.dumps([int(c) for c in cells]))
+        ).fetchone() is not None
+
+    def add_conformation(self, conformation, solver=None, job=None, source=None):
+        """
+        Appends a Conformation, solver defaults to its own
+        """
+        return self.add(
+            solver or conformation.solver, conformation.n_atoms, conformation.lattice_length,
+            conformation.cells, energy=_known(conformation.energy), U=_known(conformation.U),
+            valid=conformation.valid, job=job, source=source
+        )
+
+    def add_batch(self, batch, source=None):
+        """
+        Appends every row of a ConformationBatch in one transaction
+        """
+        created = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO results (job, solver, n_atoms, lattice_length, cells,'
+                ' energy, U, valid, source, created)'
+                ' VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((solver, batch.n_atoms, batch.lattice_length, json.dumps(cells),
+                  _known(energy), _known(U), int(valid), source, created)
+                 for solver, cells, energy, U, valid in zip(
+                     batch.solver, batch.cells.tolist(), batch.energy.tolist(),
+                     batch.U.tolist(), batch.valid.tolist()))
+            )
+
+    def conformations(self, n_atoms, lattice_length, solver=None, max_U=None, valid=None, limit=None):
+        """
+        Like query for one problem size but returns a ConformationBatch
+        """
+        rows = self.query(solver, n_atoms, lattice_length, max_U, valid, limit)
+        cells = np.array([row['cells'] for row in rows], dtype=int).reshape(len(rows), n_atoms)
+        return ConformationBatch(
+            cells, lattice_length,
+            [np.nan if row['energy'] is None else row['energy'] for row in rows],
+            [np.nan if row['U'] is None else row['U'] for row in rows],
+            [bool(row['valid']) for row in rows],
+            [row['solver'] for row in rows]
+        )
+
+    def add_solution(self, problem, solver, solution, **kwargs):
+        """
+        Appends a 0-1 solution vector of a MolecularConformation,
+        scoring it on the way in
+        """
+        energy = kwargs.pop('energy', np.nan)
+        conformation = Conformation.from_solution(problem, solution, energy, solver)
+        return self.add_conformation(conformation, **kwargs)
+
+    def import_aggregated(self, file_path=Path.joinpath(RESULTS_DIR, 'aggregated.json')):
+        """
+        Imports the old aggregated.json, {solver: {'BxL': [[q, ...], ...]}}
+        where every list holds the binary variables that were 1.
+        Returns how many results were added
+        """
+        with open(file_path, 'r') as in_file:
+            data = json.load(in_file)
+
+        added = 0
+        for solver, sizes in data.items():
+            for size_str, solutions in sizes.items():
+                [B, L] = [int(n) for n in size_str.split('x')]
+                for indices in solutions:
+                    added += self._import_indices(solver, B, L, indices, source='aggregated.json')
+        return added
+
+    def import_cplex(self, directory=Path.joinpath(RESULTS_DIR, 'cplex')):
+        """
+        Imports the NEOS CPLEX logs named B.L.txt. The LP file numbers the
+        variables from x1 so xn is the binary variable n - 1.
+        Logs without a final solution are skipped.
+        Returns how many results were added
+        """
+        added = 0
+        for file_path in sorted(Path(directory).glob('*.txt')):
+            [B, L] = [int(n) for n in file_path.stem.split('.')]
+            parsed = parse_cplex_log(file_path.read_text())
+            if parsed is None:
+                continue
+            [energy, indices] = parsed
+            added += self._import_indices('cplex', B, L, indices,
+                                          energy=energy, source=file_path.name)
+        return added
+
+    def _import_indices(self, solver, B, L, indices, **kwargs):
+        from problem import MolecularConformation
+
+        problem = MolecularConformation(B, L)
+        solution = np.zeros(B * problem.N_CELLS, dtype=np.int8)
+        solution[indices] = 1
+        conformation = Conformation.from_solution(problem, solution, kwargs.pop('energy', np.nan), solver)
+        if self.contains(solver, B, L, conformation.cells):
+            return 0
+        self.add_conformation(conformation, **kwargs)
+        return 1
+
+
+def parse_cplex_log(text):
+    """
+    The final solution in the output of CPLEX on NEOS for the LP of
+    LpWriter, whose variable xn is the binary variable n - 1.
+    Returns (objective or None, indices of the variables that are 1),
+    None if there is no final solution
+    """
+    if 'Incumbent solution' not in text:
+        return None
+    solution = text[text.rindex('Incumbent solution'):]
+    indices = [int(n) - 1 for n in re.findall(r'^x(\d+)\s+1\.0+$', solution, re.M)]
+    objective = re.findall(r'Objective =\s+(\S+)', text)
+    return (float(objective[-1]) if objective else None), indices
+
+
+def _known(value):
+    """
+    NaN marks an unknown value in a Conformation, NULL in the store
+    """
+    return None if np.isnan(value) else value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=['import', 'best'],
+                        help='import the old result files or show the best results')
+    parser.add_argument('-s', '--solver', type=str, default=None)
+    parser.add_argument('-B', '--num_molecules', type=int, default=None)
+    parser.add_argument('-L', '--lattice_size', type=int, default=None)
+    parser.add_argument('-n', '--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    with ResultStore() as store:
+        if args.command == 'import':
+            # the logs first, they also have the CPLEX objective value
+            print('cplex:', store.import_cplex(), 'added')
+            print('aggregated.json:', store.import_aggregated(), 'added')
+        else:
+            for row in store.query(args.solver, args.num_molecules,
+                                   args.lattice_size, limit=args.limit):
+                print(f"{row['solver']} {row['n_atoms']}x{row['lattice_length']}"
+                      f" U {row['U']} valid {bool(row['valid'])} cells {row['cells']}")
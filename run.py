@@ -1,9 +1,9 @@
-import neal
-from dwavesolver import DwaveSolver
-from qiskitsolver import QiskitSolver
-from cplexsolver import CplexNeosSolver
-from dwave.system import LeapHybridSampler, DWaveSampler, EmbeddingComposite
+from timeit import default_timer as timer
+start_time = timer()
+
 from cliparser import parser
+from instrumentation import Instrument, JsonLinesSink, NULL_INSTRUMENT
+from solvers import load_solver, make_sampler
 
 if __name__ == "__main__":
     args = parser.parse_args()
@@ -11,26 +11,62 @@ if __name__ == "__main__":
         'no_time': args.no_time,
         'verbosity': args.verbosity
     }
+    instrument = NULL_INSTRUMENT
+    if args.profile is not None:
+        instrument = Instrument(
+            JsonLinesSink(args.profile),
+            solver=args.solver, n_atoms=args.num_molecules, lattice_length=args.lattice_size
+        )
+        options['instrument'] = instrument
+
+    # only the chosen backend is imported
+    solverClass = load_solver(args.solver)
 
-    if args.solver in ['hybrid', 'embed', 'sim_anneal', 'tabu']:
-        solverClass = DwaveSolver
+    if args.solver in ['hybrid', 'embed', 'sim_anneal', 'tabu', 'parallel_tempering']:
+        options['solver'] = make_sampler(args.solver)
+        options['visualize'] = args.visualize
+        options['top_samples'] = args.sols_to_print
+        options['workers'] = args.workers
+        options['prune'] = args.prune
+        options['cache'] = args.cache
+        options['seed'] = args.seed
+        options['encoding'] = args.encoding
+        options['target_U'] = args.target_U
+        options['tempering'] = {'num_replicas': args.replicas, 'num_sweeps': args.sweeps}
 
-        if args.solver == 'hybrid':
-            options['solver'] = LeapHybridSampler()
-        elif args.solver == 'embed':
-            options['solver'] = EmbeddingComposite(DWaveSampler())
-        elif args.solver == 'sim_anneal':
-            options['solver'] = neal.SimulatedAnnealingSampler()
-        elif args.solver == 'tabu':
-            options['solver'] = 'tabu'
+    elif args.solver == 'chain':
+        options['solver'] = make_sampler(args.solver)
+        options['visualize'] = args.visualize
+        options['top_samples'] = args.sols_to_print
+        options['seed'] = args.seed
+        if args.window is not None:
+            options['window'] = args.window
 
+    elif args.solver == 'multires':
+        options['solver'] = make_sampler(args.solver)
         options['visualize'] = args.visualize
         options['top_samples'] = args.sols_to_print
+        options['seed'] = args.seed
+        options['levels'] = args.levels
+        options['radius'] = args.radius
+
+    elif args.solver == 'local':
+        options['visualize'] = args.visualize
+        options['top_samples'] = args.sols_to_print
+        options['seed'] = args.seed
+
+    elif args.solver == 'exact':
+        options['visualize'] = args.visualize
+        options['workers'] = args.workers
+        options['seed'] = args.seed
 
-    elif args.solver == 'cplex':
-        solverClass = CplexNeosSolver
-    elif args.solver == 'qiskit':
-        solverClass = QiskitSolver
+    startup_time = timer() - start_time
+    instrument.timing('startup', startup_time)
+    if args.verbosity > 1:
+        print(f'startup time: {startup_time} s')
 
     solver = solverClass(args.num_molecules, args.lattice_size)
+    solver.CUTOFF = args.cutoff
+    solver.CUTOFF_SHIFT = args.cutoff_shift
     solver.solve(options)
+    instrument.close()
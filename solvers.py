@@ -0,0 +1,67 @@
+'''
+Registry of the solvers selectable with -s. Backends are only imported
+when they are loaded, so a run pays the import time (and needs the
+dependencies) of the one solver it uses.
+'''
+
+import importlib
+from collections import namedtuple
+
+# module and class of the solver, and a function returning the sampler
+# handed to DwaveSolver as options['solver'] (None for other solvers)
+SolverSpec = namedtuple('SolverSpec', ['module', 'class_name', 'make_sampler'])
+
+
+def _tabu():
+    return 'tabu'
+
+
+def _hybrid():
+    from dwave.system import LeapHybridSampler
+    return LeapHybridSampler()
+
+
+def _embed():
+    from dwave.system import DWaveSampler, EmbeddingComposite
+    return EmbeddingComposite(DWaveSampler())
+
+
+def _sim_anneal():
+    import neal
+    return neal.SimulatedAnnealingSampler()
+
+
+def _parallel_tempering():
+    from paralleltempering import ParallelTemperingSampler
+    return ParallelTemperingSampler()
+
+
+SOLVERS = {
+    'tabu': SolverSpec('dwavesolver', 'DwaveSolver', _tabu),
+    'hybrid': SolverSpec('dwavesolver', 'DwaveSolver', _hybrid),
+    'embed': SolverSpec('dwavesolver', 'DwaveSolver', _embed),
+    'sim_anneal': SolverSpec('dwavesolver', 'DwaveSolver', _sim_anneal),
+    'parallel_tempering': SolverSpec('dwavesolver', 'DwaveSolver', _parallel_tempering),
+    'chain': SolverSpec('chainsolver', 'ChainDecompositionSolver', _sim_anneal),
+    'multires': SolverSpec('multiresolution', 'MultiresolutionSolver', _tabu),
+    'local': SolverSpec('localsearch', 'LocalSearchSolver', None),
+    'exact': SolverSpec('exactsolver', 'ExactSolver', None),
+    'cplex': SolverSpec('cplexsolver', 'CplexNeosSolver', None),
+    'qiskit': SolverSpec('qiskitsolver', 'QiskitSolver', None),
+}
+
+
+def load_solver(name):
+    """
+    Imports the backend of solver name and returns its class
+    """
+    spec = SOLVERS[name]
+    return getattr(importlib.import_module(spec.module), spec.class_name)
+
+
+def make_sampler(name):
+    """
+    The sampler for a DwaveSolver backed solver, None for the others
+    """
+    spec = SOLVERS[name]
+    return spec.make_sampler() if spec.make_sampler is not None else None
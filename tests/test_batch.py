@@ -0,0 +1,59 @@
+'''
+Resuming a parameter sweep: jobs already in the store are not run again,
+failed ones are.
+'''
+
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+
+import batch
+
+JOBS = batch.make_jobs([[3, 3]], ['local'], [], [0, 1])
+# more atoms than spots, the job fails
+IMPOSSIBLE = batch.make_jobs([[28, 3]], ['local'], [], [0])
+
+
+class RecordingPool(ProcessPoolExecutor):
+    """
+    The process pool of run_sweep, keeping the key of every job it was given
+    """
+    submitted = []
+
+    def submit(self, function, job):
+        RecordingPool.submitted.append(batch.job_key(job))
+        return super().submit(function, job)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    RecordingPool.submitted = []
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', RecordingPool)
+    return RecordingPool
+
+
+def stored_jobs(file_path):
+    with batch.ResultStore(file_path) as store:
+        return sorted(row['job'] for row in store.query())
+
+
+def test_second_run_does_no_work(tmp_path, pool):
+    file_path = tmp_path / 'results.db'
+    assert batch.run_sweep(JOBS, file_path) == []
+    assert sorted(pool.submitted) == sorted(map(batch.job_key, JOBS))
+    assert stored_jobs(file_path) == sorted(map(batch.job_key, JOBS))
+
+    pool.submitted = []
+    assert batch.run_sweep(JOBS, file_path) == []
+    assert pool.submitted == []
+    assert stored_jobs(file_path) == sorted(map(batch.job_key, JOBS))
+
+
+def test_failed_jobs_are_retried(tmp_path, pool):
+    file_path = tmp_path / 'results.db'
+    failed = [batch.job_key(job) for job in IMPOSSIBLE]
+    assert batch.run_sweep(JOBS[:1] + IMPOSSIBLE, file_path) == failed
+    assert stored_jobs(file_path) == [batch.job_key(JOBS[0])]
+
+    pool.submitted = []
+    assert batch.run_sweep(JOBS[:1] + IMPOSSIBLE, file_path) == failed
+    assert pool.submitted == failed
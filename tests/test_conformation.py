@@ -0,0 +1,98 @@
+'''
+Decoding and scoring of samples into ConformationBatches, and their binary
+form, on 3 atoms in a 3x3x3 lattice.
+'''
+
+import dimod
+import numpy as np
+import pytest
+
+from conformation import Conformation, ConformationBatch
+from dwavesolver import DwaveSolver
+
+B, L = 3, 3
+
+
+@pytest.fixture
+def problem():
+    return DwaveSolver(B, L)
+
+
+@pytest.fixture
+def sampler():
+    return dimod.RandomSampler()
+
+
+def test_from_samples_empty(problem):
+    batch = ConformationBatch.from_samples(problem, np.zeros((0, B * problem.N_CELLS), dtype=np.int8))
+    assert len(batch) == 0
+    assert batch.cells.shape == (0, B)
+
+
+@pytest.mark.parametrize('encoding', [None, 'binary', 'domain_wall'])
+def test_sampleset_to_batch_empty(problem, sampler, encoding):
+    if encoding is None:
+        Q = problem.make_bqm()
+    else:
+        encoding = problem.make_encoding(encoding)
+        Q = problem.make_encoded_bqm(encoding)
+    response = sampler.sample(Q, num_reads=2, seed=0)
+    batch = problem.sampleset_to_batch(response.truncate(0), encoding)
+    assert len(batch) == 0
+    assert batch.cells.shape == (0, B)
+
+
+def test_solve_prints_no_samples(problem, sampler):
+    response = problem.solve({'solver': sampler, 'top_samples': 0, 'repititions': 1, 'no_time': True})
+    assert len(response) > 0
+
+
+def assert_same_batch(batch, expected):
+    assert batch.lattice_length == expected.lattice_length
+    np.testing.assert_array_equal(batch.cells, expected.cells)
+    assert batch.cells.dtype == expected.cells.dtype
+    np.testing.assert_array_equal(batch.energy, expected.energy)
+    np.testing.assert_array_equal(batch.U, expected.U)
+    np.testing.assert_array_equal(batch.valid, expected.valid)
+    assert list(batch.solver) == list(expected.solver)
+
+
+def mixed_batch(problem):
+    # valid, two atoms in one spot, an atom in no spot
+    cells = np.array([[0, 1, 2], [4, 4, 5], [-1, 7, 8], [26, 13, 0], [3, 9, 3]])
+    batch = ConformationBatch.from_cells(problem, cells, energy=[-1.5, 2, np.nan, 0, 7])
+    return ConformationBatch.concatenate([
+        batch[:2], ConformationBatch(batch.cells[2:4], L, batch.energy[2:4], batch.U[2:4], solver='tabu'),
+        ConformationBatch(batch.cells[4:], L, batch.energy[4:], batch.U[4:], solver=['local']),
+    ])
+
+
+@pytest.mark.parametrize('batch', [
+    ConformationBatch.from_conformations([], L),
+    ConformationBatch(np.zeros((0, B), dtype=int), L),
+], ids=['no atoms', 'no rows'])
+def test_round_trip_empty(batch):
+    assert_same_batch(ConformationBatch.from_bytes(batch.to_bytes()), batch)
+
+
+def test_round_trip_mixed(problem, tmp_path):
+    batch = mixed_batch(problem)
+    assert list(batch.valid) == [True, False, False, True, False]
+    assert list(batch.solver) == [None, None, 'tabu', 'tabu', 'local']
+    assert_same_batch(ConformationBatch.from_bytes(batch.to_bytes()), batch)
+
+    batch.save(tmp_path / 'batch.conf')
+    assert_same_batch(ConformationBatch.load(tmp_path / 'batch.conf'), batch)
+
+    for conformation in batch:
+        loaded = Conformation.from_bytes(conformation.to_bytes())
+        assert loaded == conformation
+        assert (loaded.valid, loaded.solver) == (conformation.valid, conformation.solver)
+        np.testing.assert_array_equal([loaded.energy, loaded.U], [conformation.energy, conformation.U])
+
+
+def test_from_bytes_rejects_other_data(problem):
+    data = bytearray(mixed_batch(problem).to_bytes())
+    data[:4] = b'JUNK'
+    with pytest.raises(ValueError):
+        ConformationBatch.from_bytes(bytes(data))
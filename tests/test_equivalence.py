@@ -0,0 +1,122 @@
+'''
+The fast paths against the slow references they replaced, on 3 atoms in a
+3x3x3 lattice: the sparse hamiltonian against the dense one, the
+vectorized scoring and the compact encodings against the energy of the
+hamiltonian, the branch and bound against brute force, and the canonical
+form against the symmetries it removes.
+'''
+
+import itertools
+import numpy as np
+import pytest
+
+from dwavesolver import DwaveSolver
+from exactsolver import ExactSolver
+
+B, L = 3, 3
+
+
+@pytest.fixture
+def problem():
+    return DwaveSolver(B, L)
+
+
+def random_conformations(problem, count, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.array([rng.choice(problem.N_CELLS, problem.N_ATOMS, replace=False) for _ in range(count)])
+
+
+def dense(rows, cols, values, size):
+    Q = np.zeros((size, size))
+    np.add.at(Q, (rows, cols), values)
+    return Q + Q.T
+
+
+def test_sparse_matches_dense(problem):
+    size = problem.N_ATOMS * problem.N_CELLS
+    rows, cols, constraint, objective = problem.make_components()
+    Q_constraint = problem.constraint_Q(scale=True)
+    Q_objective = problem.objective_Q(scale=True)
+    np.testing.assert_allclose(dense(rows, cols, constraint, size), Q_constraint + Q_constraint.T,
+                               rtol=1e-9, atol=0)
+    np.testing.assert_allclose(dense(rows, cols, objective, size), Q_objective + Q_objective.T,
+                               rtol=1e-9, atol=0)
+
+
+def test_objective_values_match_bqm_energy(problem):
+    size = problem.N_ATOMS * problem.N_CELLS
+    samples = (np.random.default_rng(1).random((50, size)) < 0.05).astype(np.int8)
+    U, violations = problem.objective_values(samples)
+
+    # rounding of the A terms, about what a kcal of U weighs
+    energies = problem.make_bqm().energies((samples, list(range(size))))
+    expected = problem.A * (violations - problem.N_ATOMS) / 2 + problem.B * U / problem.objective_scale()
+    np.testing.assert_allclose(energies, expected, rtol=0, atol=1e-15 * problem.A * size)
+
+    # without the constraints U is not drowned by A
+    problem.A = 0
+    energies = problem.make_bqm().energies((samples, list(range(size))))
+    np.testing.assert_allclose(energies, problem.B * U / problem.objective_scale(), rtol=1e-9, atol=0)
+
+
+def spot_codes(encoding):
+    """
+    The 0-1 values of one atom for every spot, found by decoding every pattern
+    """
+    patterns = np.array(list(itertools.product([0, 1], repeat=encoding.width)), dtype=np.int8)
+    codes = {}
+    for pattern, cell in zip(patterns, encoding.decode(patterns)[:, 0]):
+        if cell >= 0:
+            codes.setdefault(int(cell), pattern)
+    return codes
+
+
+@pytest.mark.parametrize('name', ['binary', 'domain_wall'])
+def test_encodings_match_one_hot(problem, name):
+    # without the constraints, their A would hide any error in U
+    problem.A = 0
+    encoding = problem.make_encoding(name)
+    codes = spot_codes(encoding)
+    assert sorted(codes) == list(range(problem.N_CELLS))
+
+    polynomial = problem.make_polynomial(encoding)
+    bqm = problem.make_bqm()
+    # the expansion sums terms many orders of magnitude apart, U is exact
+    # to about a kcal
+    kcal = problem.B / problem.objective_scale()
+    for cells in random_conformations(problem, 50):
+        values = np.concatenate([codes[cell] for cell in cells])
+        one_hot = np.zeros(problem.N_ATOMS * problem.N_CELLS, dtype=np.int8)
+        one_hot[problem.ij_to_q(np.arange(problem.N_ATOMS), cells)] = 1
+        assert polynomial.energy(dict(enumerate(values.tolist()))) == pytest.approx(
+            bqm.energy(dict(enumerate(one_hot.tolist()))), rel=1e-6, abs=kcal)
+
+
+def test_exact_solver_matches_brute_force():
+    solver = ExactSolver(B, L)
+    cells, U, _ = solver.search(seed=0)
+
+    every = np.array(list(itertools.permutations(range(solver.N_CELLS), solver.N_ATOMS)))
+    all_U, violations = solver.objective_values(every)
+    assert (violations == 0).all()
+    assert U == pytest.approx(all_U.min(), rel=1e-9)
+    assert solver.objective_values(cells[None, :])[0][0] == pytest.approx(U, rel=1e-9)
+
+
+def test_canonical_form_is_invariant(problem):
+    rng = np.random.default_rng(2)
+    symmetries = problem.symmetries()
+    strides = problem.LATTICE_LENGTH ** np.arange(3)
+    for cells in random_conformations(problem, 20, seed=3):
+        image = symmetries[rng.integers(len(symmetries))][cells]
+        # shift as far as it goes on every axis, then back by a random amount
+        coordinates = problem.cell_coordinates()[image]
+        coordinates += problem.LATTICE_LENGTH - 1 - coordinates.max(axis=0)
+        coordinates -= rng.integers(0, coordinates.min(axis=0) + 1)
+        image = coordinates @ strides
+        if rng.random() < 0.5:
+            image = image[::-1]
+
+        np.testing.assert_array_equal(problem.canonical_form(image), problem.canonical_form(cells))
+        assert problem.objective_values(image[None, :])[0][0] == pytest.approx(
+            problem.objective_values(cells[None, :])[0][0], rel=1e-9)
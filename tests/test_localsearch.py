@@ -0,0 +1,70 @@
+'''
+The incremental energy changes of the local search moves against scoring
+the conformations before and after in full, on 5 atoms in a 4x4x4 lattice.
+'''
+
+import itertools
+import numpy as np
+import pytest
+
+from localsearch import LocalSearchSolver
+
+B, L = 5, 4
+
+
+@pytest.fixture
+def solver():
+    solver = LocalSearchSolver(B, L)
+    solver._tables, solver._kinds = solver.energy_tables()
+    return solver
+
+
+def random_placements(solver, count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.choice(solver.N_CELLS, solver.N_ATOMS, replace=False) for _ in range(count)]
+
+
+def assert_delta_matches(solver, cells, moved, targets):
+    new_cells = cells.copy()
+    new_cells[moved] = targets
+    [before, after] = solver.objective_values(np.array([cells, new_cells]))[0]
+    assert solver.delta_energy(cells, moved, targets) == pytest.approx(
+        after - before, rel=1e-9, abs=1e-9 * max(abs(before), abs(after), 1))
+
+
+def test_relocate(solver):
+    for cells in random_placements(solver, 5):
+        empty = np.setdiff1d(np.arange(solver.N_CELLS), cells)
+        for i in range(solver.N_ATOMS):
+            assert_delta_matches(solver, cells, np.array([i]), empty[i::7][:1])
+
+
+def test_swap(solver):
+    for cells in random_placements(solver, 5):
+        for i, k in itertools.combinations(range(solver.N_ATOMS), 2):
+            assert_delta_matches(solver, cells, np.array([i, k]), np.array([cells[k], cells[i]]))
+
+
+def test_proposed_moves(solver):
+    """
+    Every move propose draws, crankshafts of the ends and of inner pairs
+    included, from compact chains where they fit in the lattice
+    """
+    rng = np.random.default_rng(1)
+    kinds = set()
+    for cells in random_placements(solver, 5) + [np.array([0, 1, 5, 6, 2]), np.array([21, 22, 26, 25, 41])]:
+        occupied = np.zeros(solver.N_CELLS, dtype=bool)
+        occupied[cells] = True
+        for _ in range(200):
+            proposal = solver.propose(cells, occupied, rng)
+            if proposal is None:
+                continue
+            moved, targets = proposal
+            if len(moved) == 1:
+                kinds.add('single')
+            elif (targets == cells[moved[::-1]]).all():
+                kinds.add('swap')
+            else:
+                kinds.add('crankshaft')
+            assert_delta_matches(solver, cells, moved, targets)
+    assert kinds == {'single', 'swap', 'crankshaft'}
@@ -0,0 +1,55 @@
+'''
+The asynchronous NEOS client against the local stand-in server.
+'''
+
+import time
+import pytest
+
+from conformation import Conformation
+from cplexsolver import solve_sizes
+from cplexsolver.asyncneos import run_jobs
+from cplexsolver.localneos import LocalNeosServer, solve_locally
+
+DURATION = 1.0      # seconds every job waits on the server before it is solved
+SIZES = [[3, 3], [4, 3], [3, 4], [5, 3]]
+
+
+@pytest.fixture
+def server():
+    with LocalNeosServer(duration=DURATION) as server:
+        yield server
+
+
+def test_jobs_run_concurrently(server):
+    solved = []
+
+    def solve(xml):
+        solved.append(time.monotonic())
+        return solve_locally(xml)
+
+    server.solve = solve
+    start_time = time.monotonic()
+    conformations = solve_sizes(SIZES, server=server.url, poll_interval=0.05, max_interval=0.1)
+    elapsed = time.monotonic() - start_time
+
+    # every job was waiting on the server at the same time
+    assert max(solved) - min(solved) < DURATION
+    assert elapsed < len(SIZES) * DURATION
+    assert sorted(conformations) == sorted(map(tuple, SIZES))
+    for (B, L), conformation in conformations.items():
+        assert isinstance(conformation, Conformation)
+        assert (conformation.n_atoms, conformation.lattice_length) == (B, L)
+        assert conformation.valid
+        assert conformation.solver == 'cplex'
+        # the stand-in reports the U of its solution as the objective
+        assert conformation.energy == pytest.approx(conformation.U, rel=1e-9)
+
+
+def test_jobs_without_a_solution(server):
+    server.solve = lambda xml: 'no solution here\n'
+    results = run_jobs({'a': '<document/>', 'b': '<document/>'}, server=server.url,
+                       poll_interval=0.05, compress=True)
+    assert sorted(results) == ['a', 'b']
+    for name, result in results.items():
+        assert result.name == name
+        assert (result.objective, result.indices) == (None, None)
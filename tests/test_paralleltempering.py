@@ -0,0 +1,45 @@
+'''
+The Metropolis sweeps of the parallel tempering sampler: the compiled
+loops against the NumPy loop, and the kept energies against the states.
+'''
+
+import numpy as np
+import pytest
+
+import paralleltempering
+from dwavesolver import DwaveSolver
+
+REPLICAS = 8
+
+
+@pytest.fixture
+def model():
+    linear, csr, offset = paralleltempering.bqm_to_csr(DwaveSolver(3, 3).make_bqm())
+    betas = paralleltempering.default_betas(linear, csr, REPLICAS)
+    return linear, csr, offset, betas
+
+
+def run_sweeps(metropolis, model, sweeps=5, seed=0):
+    linear, csr, offset, betas = model
+    rng = np.random.default_rng(seed)
+    X = rng.integers(0, 2, (len(linear), REPLICAS), dtype=np.int8)
+    F = paralleltempering.local_fields(linear, csr, X)
+    E = paralleltempering.energies(linear, offset, X, F)
+    for _ in range(sweeps):
+        metropolis(X, F, E, -np.log(rng.random(X.shape)) / betas, *csr)
+    return X, F, E
+
+
+@pytest.mark.parametrize('metropolis', [
+    paralleltempering._metropolis_loops, paralleltempering.metropolis])
+def test_loops_match_numpy(model, metropolis):
+    for array, expected in zip(run_sweeps(metropolis, model),
+                               run_sweeps(paralleltempering._metropolis_numpy, model)):
+        np.testing.assert_array_equal(array, expected)
+
+
+def test_kept_fields_and_energies(model):
+    linear, csr, offset, _ = model
+    X, F, E = run_sweeps(paralleltempering.metropolis, model)
+    np.testing.assert_allclose(F, paralleltempering.local_fields(linear, csr, X))
+    np.testing.assert_allclose(E, paralleltempering.energies(linear, offset, X, F), rtol=1e-12)
@@ -0,0 +1,49 @@
+'''
+The LJ cutoff against the plain LJ, pair by pair, on a 3x3x3 lattice.
+'''
+
+import itertools
+import math
+import numpy as np
+import pytest
+
+from dwavesolver import DwaveSolver
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'shifted'])
+def problem(request):
+    problem = DwaveSolver(4, 3)
+    problem.CUTOFF = 1.5 * problem.CELL_LENGTH
+    problem.CUTOFF_SHIFT = request.param
+    return problem
+
+
+def lennard_jones(problem, distance):
+    return problem.leonard_jones_potential(np.array([distance]))[0]
+
+
+def test_same_spot_has_no_potential(problem):
+    lj, _ = problem.potential_tables()
+    middle = problem.LATTICE_LENGTH - 1
+    assert lj[middle, middle, middle] == 0
+
+
+def test_cutoff_error_matches_direct_comparison(problem):
+    shift = lennard_jones(problem, problem.CUTOFF) if problem.CUTOFF_SHIFT else 0
+    span = range(-(problem.LATTICE_LENGTH - 1), problem.LATTICE_LENGTH)
+    max_pair_error = 0
+    for displacement in itertools.product(span, repeat=3):
+        distance = problem.CELL_LENGTH * math.sqrt(sum(d ** 2 for d in displacement))
+        if distance == 0:
+            continue
+        full = lennard_jones(problem, distance)
+        cut = full - shift if distance <= problem.CUTOFF else 0
+        max_pair_error = max(max_pair_error, abs(cut - full))
+
+    cells = list(itertools.product(range(problem.LATTICE_LENGTH), repeat=3))
+    kept = sum(math.dist(a, b) * problem.CELL_LENGTH <= problem.CUTOFF for a in cells for b in cells)
+
+    error = problem.cutoff_error()
+    assert error['max_pair_error'] == pytest.approx(max_pair_error, rel=1e-9)
+    assert error['max_total_error'] == pytest.approx(2 * 3 * max_pair_error, rel=1e-9)
+    assert error['dropped_pairs'] == pytest.approx(1 - kept / len(cells) ** 2)
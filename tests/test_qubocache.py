@@ -0,0 +1,36 @@
+'''
+The on-disk hamiltonian cache against building the hamiltonian, on 3
+atoms in a 3x3x3 lattice.
+'''
+
+import numpy as np
+import pytest
+
+from dwavesolver import DwaveSolver
+from qubocache import QuboCache
+
+
+@pytest.fixture
+def problem():
+    return DwaveSolver(3, 3)
+
+
+def assert_same_coo(coo, expected):
+    for array, expected_array in zip(coo, expected):
+        np.testing.assert_array_equal(array, expected_array)
+
+
+def test_hit_matches_build(problem, tmp_path):
+    cache = QuboCache(tmp_path)
+    expected = problem.make_coo()
+    assert_same_coo(cache.coo(problem), expected)
+    assert cache.load(cache.key(problem)) is not None
+    assert_same_coo(cache.coo(problem), expected)
+
+
+def test_entry_over_max_bytes(problem, tmp_path):
+    cache = QuboCache(tmp_path, max_bytes=0)
+    expected = problem.make_coo()
+    for _ in range(2):
+        assert_same_coo(cache.coo(problem), expected)
+        assert cache.entries() == []
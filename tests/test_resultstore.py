@@ -0,0 +1,124 @@
+'''
+The SQLite result store: inserting and querying, several processes
+writing at once, and importing the old result files from small fixtures.
+'''
+
+import json
+import multiprocessing
+import numpy as np
+import pytest
+
+from conformation import ConformationBatch
+from problem import MolecularConformation
+from resultstore import ResultStore, parse_cplex_log
+
+WRITERS, ROWS = 4, 25
+
+CPLEX_LOG = '''Job 1 started
+MIP - Integer optimal, tolerance (0.0001/1e-06):  Objective =  3.1574218513e+06
+CPLEX> Incumbent solution
+Variable Name           Solution Value
+x1                            1.000000
+x41                           1.000000
+x63                           1.000000
+All other variables in the range 1-81 are 0.
+'''
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ResultStore(tmp_path / 'results.db') as store:
+        yield store
+
+
+def write_rows(file_path, writer):
+    with ResultStore(file_path) as store:
+        for row in range(ROWS):
+            store.add('tabu', 3, 3, [writer, row, 26], U=row, job=f'{writer}/{row}')
+
+
+def test_add_and_query(store):
+    store.add('tabu', 3, 3, [0, 1, 2], energy=-1.0, U=5.0, valid=True, job='a')
+    store.add('tabu', 3, 3, [0, 1, 1], U=1.0, valid=False)
+    store.add('sim_anneal', 3, 3, [3, 4, 5], U=2.0, valid=True, job='b')
+    store.add('tabu', 4, 3, [0, 1, 2, 3], valid=True)
+
+    assert [row['U'] for row in store.query(n_atoms=3)] == [1.0, 2.0, 5.0]
+    assert [row['cells'] for row in store.query(solver='tabu', valid=True)] == [[0, 1, 2], [0, 1, 2, 3]]
+    assert [row['solver'] for row in store.query(max_U=2.0)] == ['tabu', 'sim_anneal']
+    assert len(store.query(limit=2)) == 2
+    assert store.query(lattice_length=4) == []
+
+    [row] = store.query(solver='tabu', n_atoms=3, valid=True)
+    assert (row['energy'], row['job'], row['valid']) == (-1.0, 'a', 1)
+    assert store.finished_jobs() == {'a', 'b'}
+    assert store.contains('tabu', 3, 3, [0, 1, 1])
+    assert not store.contains('sim_anneal', 3, 3, [0, 1, 1])
+
+
+def test_batches(store):
+    problem = MolecularConformation(3, 3)
+    batch = ConformationBatch.from_cells(problem, [[0, 1, 2], [4, 4, 5], [9, 10, 11]],
+                                         energy=[np.nan, 1.0, 2.0], solver='local')
+    store.add_batch(batch, source='test')
+    store.add_conformation(batch[0], solver='tabu', job='one')
+
+    loaded = store.conformations(3, 3, solver='local')
+    assert len(loaded) == 3
+    order = np.argsort(batch.U, kind='stable')
+    np.testing.assert_array_equal(loaded.cells, batch.cells[order])
+    np.testing.assert_array_equal(loaded.energy, batch.energy[order])
+    np.testing.assert_array_equal(loaded.valid, batch.valid[order])
+    assert set(loaded.solver) == {'local'}
+    assert len(store.conformations(3, 3, solver='cplex')) == 0
+    assert store.finished_jobs() == {'one'}
+
+
+def test_concurrent_writers(tmp_path):
+    file_path = tmp_path / 'results.db'
+    ResultStore(file_path).close()
+    processes = [multiprocessing.Process(target=write_rows, args=(file_path, writer))
+                 for writer in range(WRITERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0] * WRITERS
+
+    with ResultStore(file_path) as store:
+        assert store.finished_jobs() == {f'{writer}/{row}' for writer in range(WRITERS)
+                                         for row in range(ROWS)}
+
+
+def test_parse_cplex_log():
+    assert parse_cplex_log(CPLEX_LOG) == (3.1574218513e+06, [0, 40, 62])
+    assert parse_cplex_log('Job 1 started\nError: timed out\n') is None
+
+
+def test_import_aggregated(store, tmp_path):
+    file_path = tmp_path / 'aggregated.json'
+    file_path.write_text(json.dumps({
+        'cplex': {'3x3': [[0, 40, 62]]},
+        'tabu': {'3x3': [[0, 40, 62], [23, 37, 57]], '4x3': [[0, 28, 56, 84]]},
+    }))
+    assert store.import_aggregated(file_path) == 4
+    assert store.import_aggregated(file_path) == 0
+
+    [row] = store.query(solver='cplex')
+    assert (row['n_atoms'], row['lattice_length'], row['cells']) == (3, 3, [0, 13, 8])
+    assert row['source'] == 'aggregated.json'
+    assert row['valid'] == 1
+    assert len(store.query(solver='tabu', n_atoms=3)) == 2
+
+
+def test_import_cplex(store, tmp_path):
+    (tmp_path / '3.3.txt').write_text(CPLEX_LOG)
+    (tmp_path / '4.4.txt').write_text('Job 2 started\nError: timed out\n')
+    assert store.import_cplex(tmp_path) == 1
+    assert store.import_cplex(tmp_path) == 0
+
+    [row] = store.query()
+    assert (row['solver'], row['n_atoms'], row['lattice_length']) == ('cplex', 3, 3)
+    assert row['cells'] == [0, 13, 8]
+    assert row['energy'] == 3.1574218513e+06
+    assert row['source'] == '3.3.txt'